@@ -1,5 +1,6 @@
 import prisma
 from prisma.models import enums, DocumentRecords
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
 
@@ -27,6 +28,14 @@ class DbOps:
         )
         return document_record
 
+    async def update_documents_status_by_uuids(
+        self, uuids: List[str], is_indexed: bool
+    ) -> int:
+        count = await self.prisma_client.documentrecords.update_many(
+            where={"uuid": {"in": uuids}}, data={"is_indexed": is_indexed}
+        )
+        return count
+
     async def update_document_deleted_status_by_uuid(
         self, uuid: str, is_deleted: bool
     ) -> Optional[DocumentRecords]:
@@ -35,6 +44,18 @@ class DbOps:
         )
         return document_record
 
+    async def update_document_updated_status_by_uuid(
+        self, uuid: str, is_updated: bool
+    ) -> Optional[DocumentRecords]:
+        data = {"is_updated": is_updated}
+        if is_updated:
+            # lets a refresh that is already in flight see that it is outdated
+            data["refresh_version"] = {"increment": 1}
+        document_record = await self.prisma_client.documentrecords.update(
+            where={"uuid": uuid}, data=data
+        )
+        return document_record
+
     async def get_document_record_by_url(self, url: str) -> Optional[DocumentRecords]:
         document_record = await self.prisma_client.documentrecords.find_unique(
             where={"url": url}
@@ -47,6 +68,15 @@ class DbOps:
         )
         return documents
 
+    async def get_document_record_by_url_and_repo(
+        self, url: str, repo: str
+    ) -> Optional[DocumentRecords]:
+        # url is only unique within a repo
+        document_record = await self.prisma_client.documentrecords.find_first(
+            where={"url": url, "repo": repo}
+        )
+        return document_record
+
     async def check_if_url_exists_in_repo(self, url: str, repo: str) -> bool:
         document_record = await self.prisma_client.documentrecords.find_first(
             where={"url": url, "repo": repo}
@@ -58,3 +88,168 @@ class DbOps:
             where={"is_deleted": True, "is_indexed": True}
         )
         return documents
+
+    async def claim_documents_to_index(
+        self, owner: str, limit: int, lease_seconds: int
+    ) -> List[DocumentRecords]:
+        """
+        Atomically claims up to `limit` documents that need indexing or a refresh.
+
+        Rows locked by another worker are skipped, and rows whose lease expired are
+        claimed again, so a crashed worker's documents are retried by the others.
+        Timestamps are written in UTC, like the ones Prisma writes, since the
+        columns are timestamps without time zone.
+        """
+        documents = await self.prisma_client.query_raw(
+            """
+            UPDATE "DocumentRecords"
+            SET "lease_owner" = $1,
+                "lease_expires_at" = (NOW() AT TIME ZONE 'UTC')
+                    + ($2::int * INTERVAL '1 second'),
+                "updated_at" = (NOW() AT TIME ZONE 'UTC')
+            WHERE "uuid" IN (
+                SELECT "uuid" FROM "DocumentRecords"
+                WHERE "is_deleted" = false
+                  AND "is_dead_lettered" = false
+                  AND ("is_indexed" = false OR "is_updated" = true)
+                  AND ("lease_expires_at" IS NULL
+                       OR "lease_expires_at" < (NOW() AT TIME ZONE 'UTC'))
+                  AND ("next_attempt_at" IS NULL
+                       OR "next_attempt_at" <= (NOW() AT TIME ZONE 'UTC'))
+                ORDER BY "created_at"
+                LIMIT $3
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """,
+            owner,
+            lease_seconds,
+            limit,
+            model=DocumentRecords,
+        )
+        return documents
+
+    async def release_document_lease(self, uuid: str, owner: str) -> int:
+        count = await self.prisma_client.documentrecords.update_many(
+            where={"uuid": uuid, "lease_owner": owner},
+            data={"lease_owner": None, "lease_expires_at": None},
+        )
+        return count
+
+    async def renew_document_lease(
+        self, uuid: str, owner: str, lease_seconds: int
+    ) -> int:
+        """
+        Extends the lease of a document that is still being processed by owner.
+
+        Returns:
+            int: 0 if the lease was lost to another worker, 1 otherwise.
+        """
+        count = await self.prisma_client.documentrecords.update_many(
+            where={"uuid": uuid, "lease_owner": owner},
+            data={
+                "lease_expires_at": datetime.now(timezone.utc)
+                + timedelta(seconds=lease_seconds)
+            },
+        )
+        return count
+
+    async def release_expired_leases(self) -> int:
+        """
+        Clears the leases that expired without being released, e.g. after a crash.
+        """
+        count = await self.prisma_client.documentrecords.update_many(
+            where={"lease_expires_at": {"lt": datetime.now(timezone.utc)}},
+            data={"lease_owner": None, "lease_expires_at": None},
+        )
+        return count
+
+    async def mark_document_indexed(
+        self,
+        uuid: str,
+        content_hash: Optional[str] = None,
+        refresh_version: Optional[int] = None,
+    ) -> Optional[DocumentRecords]:
+        """
+        Marks a document as indexed and clears its retry state. The hash of the
+        crawled content is kept to detect unchanged content on the next refresh.
+
+        is_updated is only cleared if refresh_version, the version the document was
+        claimed with, is still current, so a push that arrived during the refresh
+        triggers another one.
+        """
+        documents = await self.prisma_client.query_raw(
+            """
+            UPDATE "DocumentRecords"
+            SET "content_hash" = $2,
+                "is_indexed" = true,
+                "is_updated" = ($3::int IS NOT NULL AND "refresh_version" <> $3::int),
+                "attempt_count" = 0,
+                "last_error" = NULL,
+                "next_attempt_at" = NULL,
+                "updated_at" = (NOW() AT TIME ZONE 'UTC')
+            WHERE "uuid" = $1
+            RETURNING *
+            """,
+            uuid,
+            content_hash,
+            refresh_version,
+            model=DocumentRecords,
+        )
+        return documents[0] if documents else None
+
+    async def record_document_failure(
+        self,
+        uuid: str,
+        error: str,
+        max_attempts: int,
+        base_delay_seconds: int,
+        max_delay_seconds: int,
+    ) -> Optional[DocumentRecords]:
+        """
+        Records a failed attempt and schedules the next one with exponential backoff.
+        After max_attempts the document is dead-lettered and no longer claimed.
+        """
+        documents = await self.prisma_client.query_raw(
+            """
+            UPDATE "DocumentRecords"
+            SET "attempt_count" = "attempt_count" + 1,
+                "last_error" = $2,
+                "next_attempt_at" = (NOW() AT TIME ZONE 'UTC') + LEAST(
+                    $3::int * POWER(2, "attempt_count"), $4::int
+                ) * INTERVAL '1 second',
+                "is_dead_lettered" = ("attempt_count" + 1 >= $5::int),
+                "updated_at" = (NOW() AT TIME ZONE 'UTC')
+            WHERE "uuid" = $1
+            RETURNING *
+            """,
+            uuid,
+            error,
+            base_delay_seconds,
+            max_delay_seconds,
+            max_attempts,
+            model=DocumentRecords,
+        )
+        return documents[0] if documents else None
+
+    async def get_dead_lettered_documents(
+        self, repo: Optional[str] = None
+    ) -> List[DocumentRecords]:
+        where = {"is_dead_lettered": True}
+        if repo:
+            where["repo"] = repo
+        documents = await self.prisma_client.documentrecords.find_many(
+            where=where, order={"updated_at": "desc"}
+        )
+        return documents
+
+    async def requeue_dead_lettered_documents(self, uuids: List[str]) -> int:
+        count = await self.prisma_client.documentrecords.update_many(
+            where={"uuid": {"in": uuids}, "is_dead_lettered": True},
+            data={
+                "is_dead_lettered": False,
+                "attempt_count": 0,
+                "next_attempt_at": None,
+            },
+        )
+        return count
@@ -0,0 +1,6 @@
+-- AlterTable
+ALTER TABLE "DocumentRecords" ADD COLUMN     "lease_expires_at" TIMESTAMP(3),
+ADD COLUMN     "lease_owner" TEXT;
+
+-- CreateIndex
+CREATE INDEX "DocumentRecords_is_indexed_is_deleted_lease_expires_at_idx" ON "DocumentRecords"("is_indexed", "is_deleted", "lease_expires_at");
@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "DocumentRecords" ADD COLUMN     "attempt_count" INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN     "is_dead_lettered" BOOLEAN NOT NULL DEFAULT false,
+ADD COLUMN     "last_error" TEXT,
+ADD COLUMN     "next_attempt_at" TIMESTAMP(3);
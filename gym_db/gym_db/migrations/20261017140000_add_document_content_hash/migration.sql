@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "DocumentRecords" ADD COLUMN     "content_hash" TEXT;
@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "DocumentRecords" ADD COLUMN     "refresh_version" INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark of the per-request output model overhead.
+
+Compares building the output model and its tool schema on every request, as the
+agents used to, with reusing them from the output model registry.
+
+Usage: python -m gym_reader.agents.benchmark_output_models [--iterations N]
+"""
+
+import argparse
+import timeit
+from instructor import openai_schema
+from gym_reader.agents.utils import (
+    create_pydantic_model_from_signature,
+    output_model_registry,
+)
+from gym_reader.signatures.signatures import (
+    ContentExtractorSignature,
+    GenerateAnswerFromContent,
+)
+
+
+def per_request_build(signature_cls):
+    model = create_pydantic_model_from_signature(signature_cls)
+    model.model_json_schema()
+    # instructor wraps the model and generates the tool schema per request
+    return openai_schema(model).openai_schema
+
+
+def registry_lookup(signature_cls):
+    output_model_registry.get_schema(signature_cls)
+    return output_model_registry.get_model(signature_cls).openai_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    for signature_cls in [ContentExtractorSignature, GenerateAnswerFromContent]:
+        output_model_registry.register(signature_cls)
+        before = timeit.timeit(
+            lambda: per_request_build(signature_cls), number=args.iterations
+        )
+        after = timeit.timeit(
+            lambda: registry_lookup(signature_cls), number=args.iterations
+        )
+        print(
+            f"{signature_cls.__name__}: "
+            f"per request {before / args.iterations * 1e6:.1f} us, "
+            f"registry {after / args.iterations * 1e6:.1f} us, "
+            f"{before / after:.1f}x faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
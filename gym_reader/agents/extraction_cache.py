@@ -0,0 +1,122 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Type
+from gym_reader.clients.redis_client import redis_client
+from gym_reader.logger import get_logger
+from gym_reader.settings import get_settings
+
+log = get_logger(__name__)
+settings = get_settings()
+
+
+class ExtractionCache:
+    """
+    Durable cache of extraction results keyed by (content hash, signature, model).
+
+    The signature part of the key is a hash of the signature docstring and its
+    output fields, so editing the prompt invalidates the previous results. Content
+    is normalized before hashing, so whitespace-only differences and mirrors of the
+    same page share an entry. Entries expire after EXTRACTION_CACHE_TTL_SECONDS.
+    """
+
+    _instance = None
+    KEY_PREFIX = "extraction_cache"
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.enabled = settings.EXTRACTION_CACHE_ENABLED
+        self.ttl_seconds = settings.EXTRACTION_CACHE_TTL_SECONDS
+        self.redis = redis_client
+        self.signature_versions: Dict[str, str] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        normalized = " ".join(content.split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def signature_version(self, signature_cls: Type[Any]) -> str:
+        name = signature_cls.__name__
+        if name not in self.signature_versions:
+            digest = hashlib.sha256((signature_cls.__doc__ or "").encode("utf-8"))
+            for field_name, field_info in signature_cls.model_fields.items():
+                extra = field_info.json_schema_extra or {}
+                digest.update(
+                    f"{field_name}:{extra.get('__dspy_field_type')}:"
+                    f"{extra.get('desc')}:{field_info.annotation}".encode("utf-8")
+                )
+            self.signature_versions[name] = digest.hexdigest()[:16]
+        return f"{name}:{self.signature_versions[name]}"
+
+    def make_keys(
+        self,
+        content: str,
+        signature_cls: Type[Any],
+        model: str,
+        method: str,
+        variants: List[Optional[str]],
+    ) -> List[str]:
+        """
+        One key per variant, which names any other setting the result depends on,
+        such as how long documents are sectioned. The content is hashed once.
+        """
+        prefix = (
+            f"{self.KEY_PREFIX}:{self.signature_version(signature_cls)}:"
+            f"{method}:{model}:"
+        )
+        content_hash = self.content_hash(content)
+        return [
+            prefix + (f"{variant}:" if variant else "") + content_hash
+            for variant in variants
+        ]
+
+    def make_key(
+        self,
+        content: str,
+        signature_cls: Type[Any],
+        model: str,
+        method: str,
+        variant: Optional[str] = None,
+    ) -> str:
+        return self.make_keys(content, signature_cls, model, method, [variant])[0]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get_any([key])
+
+    def get_any(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the entry of the first key that is cached, with one round trip.
+        """
+        if not self.enabled:
+            return None
+        try:
+            values = self.redis.mget(keys)
+        except Exception as e:
+            log.error(f"Error reading extraction cache: {e}", exc_info=True)
+            return None
+        for value in values:
+            if value is not None:
+                self.stats["hits"] += 1
+                return json.loads(value)
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        try:
+            self.redis.set(key, json.dumps(value), ex=self.ttl_seconds)
+        except Exception as e:
+            log.error(f"Error writing extraction cache: {e}", exc_info=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+# Create a single instance of ExtractionCache
+extraction_cache = ExtractionCache()
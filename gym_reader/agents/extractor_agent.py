@@ -7,14 +7,22 @@ import logging
 from gym_reader.signatures.signatures import (
     ContentExtractorSignature,
 )
-from gym_reader.data_models import Library
-from gym_reader.agents.utils import create_pydantic_model_from_signature
+from gym_reader.data_models import CrawlerBackend, Library
+from gym_reader.agents.utils import output_model_registry
 from gym_reader.clients.instructor_client import client_instructor
 from gym_reader.data_models import PayloadForIndexing
 from gym_reader.clients.spider_web_crawler import spider_client
+from gym_reader.clients.fetchers import get_fetcher
+from gym_reader.agents.extraction_cache import extraction_cache
+from gym_reader.semantic_search.utils import TokenizedDocument
+from gym_reader.settings import get_settings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+import dspy
 import uuid
 
 log = logging.getLogger(__name__)
+settings = get_settings()
 
 
 class ContentExtractorAgent(Agent):
@@ -28,6 +36,8 @@ class ContentExtractorAgent(Agent):
         This agent extracts the keywords, summary and title from the given content.
         """
         super().__init__(DspyProgramme(signature=ContentExtractorSignature))
+        # build the output model and its tool schema once, at startup
+        output_model_registry.register(ContentExtractorSignature)
         self.instructor_programme = InstructorProgramme(client_instructor)
 
     def forward(
@@ -37,9 +47,38 @@ class ContentExtractorAgent(Agent):
         model=None,
         method=Library.INSTRUCTOR,
     ) -> PayloadForIndexing:
+        search_result = self.crawl(link)
+        return self.extract(
+            search_result, request_id=request_id, model=model, method=method
+        )
+
+    def crawl(self, link: str) -> list:
         log.info(f"Extracting content from {link}")
         search_result = spider_client.search(link)
         log.info("Extraction Complete")
+        return search_result
+
+    async def acrawl(
+        self,
+        link: str,
+        use_cache: bool = True,
+        crawler: CrawlerBackend = CrawlerBackend.SPIDER,
+        limit: int = 2,
+    ) -> list:
+        log.info(f"Extracting content from {link} with the {crawler.value} crawler")
+        search_result = await get_fetcher(crawler).fetch(
+            link, limit=limit, use_cache=use_cache
+        )
+        log.info("Extraction Complete")
+        return search_result
+
+    def extract(
+        self,
+        search_result: list,
+        request_id: str = None,
+        model=None,
+        method=Library.INSTRUCTOR,
+    ) -> PayloadForIndexing:
         parent_content = search_result[0]["content"]
         log.debug(f"Sample Parent content: {parent_content[:100]}...")
         parent_link = search_result[0]["url"]
@@ -49,51 +88,221 @@ class ContentExtractorAgent(Agent):
             child_contents.append(link["content"])
             child_links.append(link["url"])
 
+        fields, document = self._extract_fields(
+            parent_content, request_id=request_id, model=model, method=method
+        )
+        return PayloadForIndexing(
+            uuid=str(uuid.uuid5(uuid.NAMESPACE_URL, parent_link)),
+            parent_link=parent_link,
+            child_links=child_links,
+            parent_content=parent_content,
+            child_contents=child_contents,
+            parent_summary=fields["summary"],
+            parent_title=fields["title"],
+            parent_keywords=fields["keywords"],
+            parent_tokens=document.tokens if document else None,
+        )
+
+    @staticmethod
+    def _model_name(model, method: Library) -> str:
+        if isinstance(model, str):
+            return model
+        if model is None:
+            if method == Library.INSTRUCTOR:
+                return "gpt-4o"
+            model = dspy.settings.lm
+        return getattr(model, "model", None) or getattr(model, "kwargs", {}).get(
+            "model", "default"
+        )
+
+    def extract_fields(
+        self,
+        content: str,
+        request_id: str = None,
+        model=None,
+        method=Library.INSTRUCTOR,
+    ) -> Dict[str, Any]:
+        """
+        Extracts the keywords, summary and title of the content.
+
+        Results are memoized by (normalized content hash, signature, model), so
+        re-indexing unchanged content does not call the LLM again. Long documents
+        are also keyed by the reduce model and the section settings.
+        """
+        fields, _ = self._extract_fields(content, request_id, model, method)
+        return fields
+
+    def _extract_fields(
+        self,
+        content: str,
+        request_id: str = None,
+        model=None,
+        method=Library.INSTRUCTOR,
+    ) -> Tuple[Dict[str, Any], Optional[TokenizedDocument]]:
+        """
+        Returns the fields and, when the content had to be tokenized, the document.
+        """
+        long_variant = (
+            f"map_reduce:{settings.EXTRACTION_REDUCE_MODEL}:"
+            f"{settings.EXTRACTION_SECTION_TOKENS}:"
+            f"{settings.EXTRACTION_SECTION_OVERLAP_TOKENS}:"
+            f"{settings.EXTRACTION_MAX_SECTIONS}"
+        )
+        short_key, long_key = extraction_cache.make_keys(
+            content,
+            ContentExtractorSignature,
+            self._model_name(model, method),
+            method.value,
+            variants=[None, long_variant],
+        )
+        # a token is at least one byte, so content within the threshold in bytes is
+        # short without tokenizing it; longer content may be either, and a result
+        # under either key is an extraction of this exact content
+        maybe_long = (
+            len(content.encode("utf-8"))
+            > settings.EXTRACTION_LONG_DOCUMENT_THRESHOLD_TOKENS
+        )
+        cached = extraction_cache.get_any(
+            [long_key, short_key] if maybe_long else [short_key]
+        )
+        if cached is not None:
+            log.debug(f"Extraction cache hit for {short_key}")
+            return cached, None
+
+        document = TokenizedDocument(content) if maybe_long else None
+        if (
+            document is not None
+            and document.token_count
+            > settings.EXTRACTION_LONG_DOCUMENT_THRESHOLD_TOKENS
+        ):
+            fields = self.map_reduce_extract(
+                document, request_id=request_id, model=model, method=method
+            )
+            extraction_cache.set(long_key, fields)
+        else:
+            # kept local, the agent is shared by the concurrent extraction threads
+            prediction = self._predict(
+                content, request_id=request_id, model=model, method=method
+            )
+            fields = self._fields_from_prediction(prediction)
+            extraction_cache.set(short_key, fields)
+        return fields, document
+
+    def _predict(
+        self,
+        content: str,
+        request_id: str = None,
+        model=None,
+        method=Library.INSTRUCTOR,
+        system_message: str = None,
+    ):
         if method == Library.DSPY:
-            self.prediction_object = self.programme.forward(
-                content=parent_content,
+            return self.programme.forward(
+                content=content,
                 request_id=request_id,
                 model=model,
             )
-            result = PayloadForIndexing(
-                uuid=str(uuid.uuid4()),
-                parent_link=parent_link,
-                child_links=child_links,
-                parent_content=parent_content,
-                child_contents=child_contents,
-                parent_summary=self.prediction_object.summary,
-                parent_title=self.prediction_object.title,
-                parent_keywords=self.prediction_object.keywords,
-            )
-            return result
         elif method == Library.INSTRUCTOR:
             # get the docstring from the signature
-            system_message_from_docstring = ContentExtractorSignature.__doc__
+            system_message_from_docstring = (
+                system_message or ContentExtractorSignature.__doc__
+            )
             log.debug(system_message_from_docstring)
-            DynamicOutputModel = create_pydantic_model_from_signature(
+            DynamicOutputModel = output_model_registry.get_model(
                 ContentExtractorSignature
             )
-            log.debug(DynamicOutputModel.model_json_schema())
-            self.prediction_object = self.instructor_programme.forward(
+            log.debug(output_model_registry.get_schema(ContentExtractorSignature))
+            return self.instructor_programme.forward(
                 request_id=request_id,
                 model=model,
                 messages=[
                     {"role": "system", "content": system_message_from_docstring},
-                    {"role": "user", "content": parent_content},
+                    {"role": "user", "content": content},
                 ],
                 response_model=DynamicOutputModel,
             )
-            result = PayloadForIndexing(
-                uuid=str(uuid.uuid4()),
-                parent_link=parent_link,
-                child_links=child_links,
-                parent_content=parent_content,
-                child_contents=child_contents,
-                parent_summary=self.prediction_object.summary,
-                parent_title=self.prediction_object.title,
-                parent_keywords=self.prediction_object.keywords,
+
+    @staticmethod
+    def _fields_from_prediction(prediction) -> Dict[str, Any]:
+        return {
+            "keywords": prediction.keywords,
+            "summary": prediction.summary,
+            "title": prediction.title,
+        }
+
+    def map_reduce_extract(
+        self,
+        document: TokenizedDocument,
+        request_id: str = None,
+        model=None,
+        method=Library.INSTRUCTOR,
+    ) -> Dict[str, Any]:
+        """
+        Extracts the fields of a document too large for a single prompt.
+
+        The document is split into sections by token budget and the sections are
+        extracted concurrently (map). The partial results are then merged into the
+        final fields by one call to a cheaper model (reduce). Sections beyond
+        EXTRACTION_MAX_SECTIONS are sampled evenly, so latency stays bounded.
+        """
+        sections = list(
+            document.iter_chunks(
+                max_tokens=settings.EXTRACTION_SECTION_TOKENS,
+                overlap=settings.EXTRACTION_SECTION_OVERLAP_TOKENS,
+            )
+        )
+        if len(sections) > settings.EXTRACTION_MAX_SECTIONS:
+            step = len(sections) / settings.EXTRACTION_MAX_SECTIONS
+            sections = [
+                sections[int(i * step)] for i in range(settings.EXTRACTION_MAX_SECTIONS)
+            ]
+        log.info(
+            f"Extracting {document.token_count} tokens in {len(sections)} sections"
+        )
+        with ThreadPoolExecutor(
+            max_workers=settings.EXTRACTION_MAP_CONCURRENCY
+        ) as executor:
+            predictions = list(
+                executor.map(
+                    lambda section: self._predict(
+                        section.text, request_id=request_id, model=model, method=method
+                    ),
+                    sections,
+                )
             )
-            return result
+        partials = [
+            self._fields_from_prediction(prediction)
+            for prediction in predictions
+            if prediction is not None
+        ]
+        if not partials:
+            raise ValueError("Extraction failed for every section of the document")
+
+        reduce_content = "\n\n".join(
+            f"Section {i + 1}\nTitle: {partial['title']}\n"
+            f"Summary: {partial['summary']}\n"
+            f"Keywords: {', '.join(partial['keywords'])}"
+            for i, partial in enumerate(partials)
+        )
+        prediction = self._predict(
+            reduce_content,
+            request_id=request_id,
+            model=settings.EXTRACTION_REDUCE_MODEL,
+            method=Library.INSTRUCTOR,
+            system_message=ContentExtractorSignature.__doc__
+            + "\nThe content is the extracted fields of consecutive sections of one "
+            "document. Merge them into the fields of the whole document.\n",
+        )
+        if prediction is not None:
+            return self._fields_from_prediction(prediction)
+        log.warning("Reduce step failed, merging the section fields directly")
+        return {
+            "keywords": list(
+                dict.fromkeys(k for partial in partials for k in partial["keywords"])
+            ),
+            "summary": " ".join(partial["summary"] for partial in partials),
+            "title": partials[0]["title"],
+        }
 
     def __call__(
         self,
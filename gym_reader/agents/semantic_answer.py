@@ -4,19 +4,23 @@ from gym_reader.programmes.programmes import (
     TypedProgramme as DspySimpleProgramme,
     InstructorProgramme as InstructorProgramme,
 )
-from typing import List, Dict
+from typing import Any, AsyncIterator, List, Dict, Tuple
 import logging
-from gym_reader.clients.qdrant_client import qdrant_client
+from gym_reader.clients.qdrant_client import async_qdrant_client, qdrant_client
 from gym_reader.clients.meilisearch_client import meilisearch_client
-from gym_reader.clients.openai_client import openai_client
+from gym_reader.clients.openai_client import async_openai_client, openai_client
 from gym_reader.signatures.signatures import (
     GenerateAnswerFromContent,
     QueryRewriterSignature,
 )
 from gym_reader.semantic_search.hybrid_search import HybridSearch
-from gym_reader.clients.instructor_client import client_instructor
+from gym_reader.clients.instructor_client import (
+    async_client_instructor,
+    client_instructor,
+)
+from gym_reader.executor import run_blocking
 from gym_reader.data_models import Library
-from gym_reader.agents.utils import create_pydantic_model_from_signature
+from gym_reader.agents.utils import output_model_registry
 
 log = logging.getLogger(__name__)
 
@@ -36,14 +40,20 @@ class ContextAwareAnswerAgent(Agent):
         The agent uses query rewriting based on conversation history to improve search results.
         """
         super().__init__(DspyProgramme(signature=GenerateAnswerFromContent))
+        # build the output model and its tool schema once, at startup
+        output_model_registry.register(GenerateAnswerFromContent)
         self.hybrid_search = HybridSearch(
             qdrant_client=qdrant_client,
             meilisearch_client=meilisearch_client,
             openai_client=openai_client,
+            async_qdrant_client=async_qdrant_client,
+            async_openai_client=async_openai_client,
         )
         self.query_rewriter = DspySimpleProgramme(signature=QueryRewriterSignature)
         # TODO: Use this later
-        self.instructor_programme = InstructorProgramme(client_instructor)
+        self.instructor_programme = InstructorProgramme(
+            client_instructor, async_client_instructor
+        )
 
     def forward(
         self,
@@ -66,16 +76,13 @@ class ContextAwareAnswerAgent(Agent):
         if method == Library.INSTRUCTOR:
             system_message_from_docstring = GenerateAnswerFromContent.__doc__
             log.debug(system_message_from_docstring)
-            DynamicOutputModel = create_pydantic_model_from_signature(
+            DynamicOutputModel = output_model_registry.get_model(
                 GenerateAnswerFromContent
             )
-            log.debug(DynamicOutputModel.model_json_schema())
-            user_message = f"""
-            Query: {rewritten_query}
-            Conversation History: {conversation_history}
-            summary_of_contents_of_links: {search_results.summary}
-            relevant_content: {search_results.relevant_content}
-            """
+            log.debug(output_model_registry.get_schema(GenerateAnswerFromContent))
+            user_message = self._user_message(
+                rewritten_query, conversation_history, search_results
+            )
             self.prediction_object = self.instructor_programme.forward(
                 request_id=request_id,
                 model=model,
@@ -98,6 +105,116 @@ class ContextAwareAnswerAgent(Agent):
             )
             return self.prediction_object
 
+    async def aforward(
+        self,
+        search_query: str,
+        collection_name: str,
+        conversation_history: List[Dict[str, str]],
+        request_id: str = None,
+        model=None,
+    ):
+        """
+        Async variant of forward with the instructor method. Search and generation
+        run on async clients; the dspy query rewrite, which has no async API, runs in
+        the bounded executor.
+        """
+        rewritten_query = await run_blocking(
+            self.rewrite_query,
+            search_query,
+            conversation_history,
+            request_id=request_id,
+            model=model,
+        )
+        search_results = await self.hybrid_search.asearch(
+            query=rewritten_query, collection_name=collection_name
+        )
+        return await self.instructor_programme.aforward(
+            request_id=request_id,
+            model=model,
+            messages=[
+                {"role": "system", "content": GenerateAnswerFromContent.__doc__},
+                {
+                    "role": "user",
+                    "content": self._user_message(
+                        rewritten_query, conversation_history, search_results
+                    ),
+                },
+            ],
+            response_model=output_model_registry.get_model(GenerateAnswerFromContent),
+        )
+
+    async def astream(
+        self,
+        search_query: str,
+        collection_name: str,
+        conversation_history: List[Dict[str, str]],
+        request_id: str = None,
+        model=None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of aforward.
+
+        Yields:
+            Tuple[str, Any]: ("metadata", retrieval details) first, then ("token",
+            answer text delta) as the answer is generated, then ("citations", links).
+        """
+        rewritten_query = await run_blocking(
+            self.rewrite_query,
+            search_query,
+            conversation_history,
+            request_id=request_id,
+            model=model,
+        )
+        search_results = await self.hybrid_search.asearch(
+            query=rewritten_query, collection_name=collection_name
+        )
+        yield "metadata", {
+            "rewritten_query": rewritten_query,
+            "sources": [
+                {"link": link, "score": score}
+                for summary, score in zip(
+                    search_results.summary, search_results.content_score
+                )
+                for link in summary
+            ],
+        }
+        streamed_answer = ""
+        citations = []
+        partials = self.instructor_programme.astream(
+            request_id=request_id,
+            model=model,
+            messages=[
+                {"role": "system", "content": GenerateAnswerFromContent.__doc__},
+                {
+                    "role": "user",
+                    "content": self._user_message(
+                        rewritten_query, conversation_history, search_results
+                    ),
+                },
+            ],
+            response_model=output_model_registry.get_model(GenerateAnswerFromContent),
+        )
+        try:
+            async for partial in partials:
+                answer = partial.get("generated_answer") or ""
+                if len(answer) > len(streamed_answer):
+                    yield "token", answer[len(streamed_answer) :]
+                    streamed_answer = answer
+                citations = partial.get("citations") or citations
+        finally:
+            # closing it records the tokens of a stream that was cut short
+            await partials.aclose()
+        yield "citations", citations
+
+    @staticmethod
+    def _user_message(rewritten_query, conversation_history, search_results) -> str:
+        return f"""
+            Query: {rewritten_query}
+            Conversation History: {conversation_history}
+            summary_of_contents_of_links: {search_results.summary}
+            relevant_content: {search_results.relevant_content}
+            """
+
     def __call__(
         self,
         search_query,
@@ -1,8 +1,9 @@
 # from gym_reader.agents.semantic_answer import ContextAwareAnswerAgent
+import copy
 from typing import Type, Any, Dict, Optional
+from instructor import openai_schema
 from pydantic import BaseModel, Field, create_model
 
-
 # agents = [ContextAwareAnswerAgent]
 
 # _initialized = False  # Module-level flag to ensure initialization runs only once
@@ -65,3 +66,61 @@ def create_pydantic_model_from_signature(
     DynamicModel = create_model(model_name, **fields)
 
     return DynamicModel
+
+
+def _with_cached_json_schema(model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Returns a subclass of the model whose default JSON schema is generated once.
+
+    Instructor builds the tool definition from model_json_schema on every request,
+    so caching it here removes the schema generation from the request path.
+    """
+    schema = model.model_json_schema()
+
+    def model_json_schema(cls, *args, **kwargs):
+        if args or kwargs:
+            return super(cached_model, cls).model_json_schema(*args, **kwargs)
+        # callers may mutate the schema, so hand out a copy
+        return copy.deepcopy(schema)
+
+    cached_model = type(
+        model.__name__,
+        (model,),
+        {
+            "__module__": model.__module__,
+            "model_json_schema": classmethod(model_json_schema),
+        },
+    )
+    return cached_model
+
+
+class OutputModelRegistry:
+    """
+    Builds the output model of each signature once and reuses it.
+
+    The models are wrapped for instructor up front, so neither create_model nor the
+    tool schema generation run again per request.
+    """
+
+    def __init__(self):
+        self.models: Dict[Type[Any], Type[BaseModel]] = {}
+        self.schemas: Dict[Type[Any], Dict[str, Any]] = {}
+
+    def register(
+        self, signature_cls: Type[Any], model_name: str = "DynamicOutputModel"
+    ) -> Type[BaseModel]:
+        if signature_cls not in self.models:
+            model = create_pydantic_model_from_signature(signature_cls, model_name)
+            self.models[signature_cls] = openai_schema(_with_cached_json_schema(model))
+            self.schemas[signature_cls] = model.model_json_schema()
+        return self.models[signature_cls]
+
+    def get_model(self, signature_cls: Type[Any]) -> Type[BaseModel]:
+        return self.register(signature_cls)
+
+    def get_schema(self, signature_cls: Type[Any]) -> Dict[str, Any]:
+        self.register(signature_cls)
+        return self.schemas[signature_cls]
+
+
+output_model_registry = OutputModelRegistry()
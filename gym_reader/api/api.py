@@ -1,7 +1,12 @@
 from fastapi import FastAPI
 from gym_reader.settings import get_settings, initialize_dspy_with_configs
 from gym_reader.api.middlewares import ALL_MIDDLEWARES
-from gym_reader.api.routes import git_sync, keyword_search, contextual_chat
+from gym_reader.api.routes import (
+    git_sync,
+    keyword_search,
+    contextual_chat,
+    indexing_admin,
+)
 
 cfg = get_settings()
 initialize_dspy_with_configs()
@@ -20,3 +25,4 @@ async def health():
 app.include_router(git_sync.router)
 app.include_router(keyword_search.router)
 app.include_router(contextual_chat.router)
+app.include_router(indexing_admin.router)
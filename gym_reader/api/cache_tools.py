@@ -1,3 +1,4 @@
+import threading
 from cachetools import TTLCache
 
 
@@ -12,6 +13,7 @@ class Cache:
     def __init__(self, maxsize=1024, ttl=3600):
         if not hasattr(self, "initialized"):  # Ensure __init__ is only called once
             self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+            self.lock = threading.Lock()
             self.initialized = True
 
     def get(self, key):
@@ -20,6 +22,13 @@ class Cache:
     def set(self, key, value):
         self.cache[key] = value
 
+    def incr(self, key, amount):
+        # atomic read-modify-write, callers add from several threads at once
+        with self.lock:
+            value = (self.cache.get(key) or 0) + amount
+            self.cache[key] = value
+            return value
+
     def get_available_keys(self):
         return self.cache.keys()
 
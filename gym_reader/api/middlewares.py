@@ -9,7 +9,7 @@ import uuid
 import time
 import hmac
 import hashlib
-from gym_reader.settings import get_settings, TOKEN_MIDDLEWARES
+from gym_reader.settings import get_settings, STREAMING_PATHS, TOKEN_MIDDLEWARES
 from gym_reader.api.cache_tools import cache
 from gym_reader.clients.redis_client import redis_client
 
@@ -77,8 +77,22 @@ CORS_MIDDLEWARE = Middleware(
     allow_headers=["*"],
 )
 
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZip middleware that leaves Server-Sent Events uncompressed, since compressing
+    them buffers the events instead of sending each one as it is produced.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in STREAMING_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # Create instances of Middleware
-GZIP_MIDDLEWARE = Middleware(GZipMiddleware)
+GZIP_MIDDLEWARE = Middleware(StreamingAwareGZipMiddleware)
 PROCESSING_TIME_MIDDLEWARE = Middleware(ProcessingTimeMiddleware)
 HMAC_VERIFICATION_MIDDLEWARE = Middleware(HMACVerificationMiddleware)
 
@@ -127,8 +141,33 @@ class TokenLimitMiddleware(BaseHTTPMiddleware):
         if request_id not in cache.get_available_keys():
             cache.set(request_id, 0)
 
+        if request.url.path in STREAMING_PATHS:
+            # the body of a streamed response is generated after call_next returns,
+            # so the route records the usage itself once its stream is closed
+            request.state.record_usage = lambda: self._record_usage(
+                request_id, daily_key, ip_key
+            )
+            return await call_next(request)
         # Process the request and get the response
         response = await call_next(request)
+        total_tokens, daily_usage, ip_usage = self._record_usage(
+            request_id, daily_key, ip_key, daily_usage, ip_usage
+        )
+        # Add usage information to the response headers
+        response.headers[settings.TOKEN_KEY] = str(total_tokens)
+        response.headers["daily_usage"] = str(daily_usage)
+        response.headers["ip_usage"] = str(ip_usage)
+
+        return response
+
+    @staticmethod
+    def _record_usage(
+        request_id: str,
+        daily_key: str,
+        ip_key: str,
+        daily_usage: int = 0,
+        ip_usage: int = 0,
+    ):
         # Get total tokens from cache
         total_tokens = cache.get(request_id)
         log.debug(f"total_tokens: {total_tokens}")
@@ -145,12 +184,7 @@ class TokenLimitMiddleware(BaseHTTPMiddleware):
                 redis_client.expire(daily_key, 86400)  # 24 hours TTL
             if ip_usage == total_tokens:
                 redis_client.expire(ip_key, 86400)  # 24 hours TTL
-        # Add usage information to the response headers
-        response.headers[settings.TOKEN_KEY] = str(total_tokens)
-        response.headers["daily_usage"] = str(daily_usage)
-        response.headers["ip_usage"] = str(ip_usage)
-
-        return response
+        return total_tokens, daily_usage, ip_usage
 
 
 # Add the new middleware to the ALL_MIDDLEWARES list
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from gym_reader.logger import get_logger
 from gym_reader.data_models import ChatPayload, ResponseModel, Answer
 from gym_reader.agents.semantic_answer import ContextAwareAnswerAgent
-
+from gym_reader.api.cache_tools import cache
+import json
 
 log = get_logger(__name__)
 router = APIRouter()
@@ -20,7 +22,7 @@ async def keyword_search(request: Request, body: ChatPayload) -> ResponseModel:
         log.debug(f"request_id: {request_id}")
         conversation_history = [message.model_dump() for message in messages[:-1]]
         log.debug("request headers", request.headers)
-        chat_object = chat_agent(
+        chat_object = await chat_agent.aforward(
             search_query, collection_name, conversation_history, request_id
         )
         log.debug(chat_object.generated_answer)
@@ -35,3 +37,46 @@ async def keyword_search(request: Request, body: ChatPayload) -> ResponseModel:
     except Exception as e:
         log.error(e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/api/v1/contextual_chat/stream")
+async def contextual_chat_stream(request: Request, body: ChatPayload):
+    """
+    Server-Sent Events variant of contextual_chat. It emits a metadata event with
+    the retrieval results, token events with the answer as it is generated, a
+    citations event, and a done event with the tokens used by the request.
+    """
+    collection_name = body.collection_name
+    messages = body.messages
+    search_query = messages[-1].content
+    request_id = request.state.request_id
+    log.debug(f"request_id: {request_id}")
+    conversation_history = [message.model_dump() for message in messages[:-1]]
+
+    async def event_stream():
+        events = chat_agent.astream(
+            search_query, collection_name, conversation_history, request_id
+        )
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+            yield format_sse("done", {"total_tokens": cache.get(request_id)})
+        except Exception as e:
+            # the status line is already sent, so errors are reported in the stream
+            log.error(e, exc_info=True)
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            # close the generators first, a stream cut short by the client only
+            # adds its tokens when closed, then charge the request
+            await events.aclose()
+            request.state.record_usage()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,51 @@
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException
+from gym_reader.logger import get_logger
+from gym_reader.data_models import DeadLetteredDocument, RequeuePayload
+from gym_reader.clients.prisma_client import prisma_singleton
+from gym_reader.services.indexing_wakeup import notify_indexer
+from gym_db.gym_db.db_funcs import DbOps
+
+log = get_logger(__name__)
+router = APIRouter()
+
+
+async def get_dbops_client():
+    prisma_client = await prisma_singleton.get_client()
+    return DbOps(prisma_client)
+
+
+@router.get("/api/v1/indexing/dead_letters")
+async def list_dead_letters(repo: Optional[str] = None) -> List[DeadLetteredDocument]:
+    try:
+        dbops = await get_dbops_client()
+        documents = await dbops.get_dead_lettered_documents(repo)
+        return [
+            DeadLetteredDocument(
+                uuid=document.uuid,
+                url=document.url,
+                repo=document.repo,
+                attempt_count=document.attempt_count,
+                last_error=document.last_error,
+                updated_at=document.updated_at,
+            )
+            for document in documents
+        ]
+    except Exception as e:
+        log.error(e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/v1/indexing/dead_letters/requeue")
+async def requeue_dead_letters(body: RequeuePayload):
+    try:
+        dbops = await get_dbops_client()
+        count = await dbops.requeue_dead_lettered_documents(body.uuids)
+        if count:
+            # the redis call is blocking, so it runs off the event loop
+            await asyncio.to_thread(notify_indexer, "", "requeue")
+        return {"requeued": count}
+    except Exception as e:
+        log.error(e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
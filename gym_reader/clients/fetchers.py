@@ -0,0 +1,43 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+from gym_reader.clients.local_web_crawler import local_crawler_client
+from gym_reader.clients.spider_web_crawler import spider_client
+from gym_reader.data_models import CrawlerBackend
+
+
+class Fetcher(ABC):
+    """
+    Interface of the content acquisition backends.
+
+    fetch returns a list of {"url", "content"} pages in markdown, parent page first.
+    """
+
+    @abstractmethod
+    async def fetch(
+        self, url: str, limit: int = 2, use_cache: bool = True
+    ) -> List[Dict[str, Any]]: ...
+
+
+class SpiderFetcher(Fetcher):
+    async def fetch(
+        self, url: str, limit: int = 2, use_cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        return await spider_client.asearch(url, use_cache=use_cache, limit=limit)
+
+
+class LocalFetcher(Fetcher):
+    async def fetch(
+        self, url: str, limit: int = 2, use_cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        # fetching directly is cheap, so the local backend does not cache
+        return await local_crawler_client.crawl(url, limit=limit)
+
+
+FETCHERS: Dict[CrawlerBackend, Fetcher] = {
+    CrawlerBackend.SPIDER: SpiderFetcher(),
+    CrawlerBackend.LOCAL: LocalFetcher(),
+}
+
+
+def get_fetcher(backend: CrawlerBackend) -> Fetcher:
+    return FETCHERS[backend]
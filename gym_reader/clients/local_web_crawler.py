@@ -0,0 +1,216 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+import httpx
+from gym_reader.settings import get_settings
+from gym_reader.logger import get_logger
+
+log = get_logger(__name__)
+settings = get_settings()
+
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+
+
+class MarkdownConverter(HTMLParser):
+    """
+    Converts the readable part of an HTML page to markdown and collects its links.
+
+    It handles the elements documentation sites are made of: headings, paragraphs,
+    lists, links, emphasis, inline code and code blocks. Scripts, styles and page
+    chrome such as navigation, headers and footers are skipped.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "noscript", "svg", "nav", "header", "footer"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "main", "table", "tr", "br"}
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.parts: List[str] = []
+        self.links: List[str] = []
+        self.skip_depth = 0
+        self.in_pre = False
+        self.list_depth = 0
+        self.href: Optional[str] = None
+
+    def handle_starttag(self, tag: str, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        attributes = dict(attrs)
+        if tag in {"h1", "h2", "h3", "h4", "h5", "h6"}:
+            self.parts.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif tag in {"ul", "ol"}:
+            self.list_depth += 1
+        elif tag == "li":
+            self.parts.append("\n" + "  " * (self.list_depth - 1) + "- ")
+        elif tag == "pre":
+            self.in_pre = True
+            self.parts.append("\n\n```\n")
+        elif tag == "code" and not self.in_pre:
+            self.parts.append("`")
+        elif tag in {"strong", "b"}:
+            self.parts.append("**")
+        elif tag in {"em", "i"}:
+            self.parts.append("_")
+        elif tag == "a" and attributes.get("href"):
+            self.href = urldefrag(urljoin(self.base_url, attributes["href"]))[0]
+            self.links.append(self.href)
+            self.parts.append("[")
+
+    def handle_endtag(self, tag: str):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+            return
+        if self.skip_depth:
+            return
+        if tag in {"ul", "ol"}:
+            self.list_depth = max(self.list_depth - 1, 0)
+            self.parts.append("\n")
+        elif tag == "pre":
+            self.in_pre = False
+            self.parts.append("\n```\n\n")
+        elif tag == "code" and not self.in_pre:
+            self.parts.append("`")
+        elif tag in {"strong", "b"}:
+            self.parts.append("**")
+        elif tag in {"em", "i"}:
+            self.parts.append("_")
+        elif tag == "a" and self.href:
+            self.parts.append(f"]({self.href})")
+            self.href = None
+
+    def handle_data(self, data: str):
+        if self.skip_depth:
+            return
+        if self.in_pre:
+            self.parts.append(data)
+        else:
+            # collapse whitespace, but keep the spaces around inline elements
+            text = " ".join(data.split())
+            if data[:1].isspace():
+                text = " " + text
+            if data[-1:].isspace() and text.strip():
+                text = text + " "
+            self.parts.append(text)
+
+    def markdown(self) -> str:
+        text = "".join(self.parts)
+        lines = [line.rstrip() for line in text.splitlines()]
+        # collapse runs of blank lines
+        collapsed = []
+        for line in lines:
+            if line or (collapsed and collapsed[-1]):
+                collapsed.append(line)
+        return "\n".join(collapsed).strip()
+
+
+def html_to_markdown(html: str, base_url: str) -> Tuple[str, List[str]]:
+    """
+    Converts an HTML page to markdown. This runs in a worker process.
+
+    Returns:
+        Tuple[str, List[str]]: The markdown and the absolute links of the page.
+    """
+    converter = MarkdownConverter(base_url)
+    converter.feed(html)
+    converter.close()
+    return converter.markdown(), converter.links
+
+
+class LocalCrawlerClient:
+    """
+    Fetches pages directly over pooled HTTP/1.1 keep-alive connections.
+
+    The parent page is fetched first, then up to `limit - 1` of its same-host links
+    are fetched concurrently. HTML is converted to markdown in a process pool, so
+    the conversion does not hold the event loop. The result has the same shape as
+    the Spider API response: a list of {"url", "content"} with the parent first.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        # created lazily, so that they bind to the running event loop
+        self.client: Optional[httpx.AsyncClient] = None
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                http2=False,
+                follow_redirects=True,
+                timeout=settings.LOCAL_CRAWLER_TIMEOUT_SECONDS,
+                headers={"User-Agent": settings.LOCAL_CRAWLER_USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=settings.LOCAL_CRAWLER_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LOCAL_CRAWLER_MAX_CONNECTIONS,
+                ),
+            )
+        return self.client
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=settings.LOCAL_CRAWLER_CONVERT_WORKERS
+            )
+        return self.process_pool
+
+    async def _fetch_page(self, url: str) -> Tuple[str, str, List[str]]:
+        # the headers are checked before the body, so binaries are never downloaded
+        async with self._get_client().stream("GET", url) as response:
+            response.raise_for_status()
+            final_url = str(response.url)
+            content_type = response.headers.get("content-type", "text/html")
+            if content_type.split(";")[0].strip().lower() not in HTML_CONTENT_TYPES:
+                raise ValueError(f"{final_url} is not an HTML page ({content_type})")
+            await response.aread()
+        markdown, links = await asyncio.get_running_loop().run_in_executor(
+            self._get_process_pool(), html_to_markdown, response.text, final_url
+        )
+        return final_url, markdown, links
+
+    async def crawl(self, url: str, limit: int = 2) -> List[Dict[str, Any]]:
+        parent_url, parent_content, links = await self._fetch_page(url)
+        pages = [{"url": parent_url, "content": parent_content}]
+        host = urlparse(parent_url).netloc
+        child_urls = []
+        for link in links:
+            if (
+                urlparse(link).netloc == host
+                and link != parent_url
+                and link not in child_urls
+            ):
+                child_urls.append(link)
+        child_urls = child_urls[: max(limit - 1, 0)]
+        results = await asyncio.gather(
+            *(self._fetch_page(child_url) for child_url in child_urls),
+            return_exceptions=True,
+        )
+        for child_url, result in zip(child_urls, results):
+            if isinstance(result, Exception):
+                log.warning(f"Skipping child page {child_url}: {result}")
+                continue
+            child_final_url, child_content, _ = result
+            pages.append({"url": child_final_url, "content": child_content})
+        return pages
+
+
+# Create a single instance of LocalCrawlerClient
+local_crawler_client = LocalCrawlerClient()
+
+if __name__ == "__main__":
+    result = asyncio.run(local_crawler_client.crawl("https://docs.python.org/3/"))
+    log.debug("Local crawl result:", result)
@@ -1,5 +1,6 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from gym_reader.settings import get_settings
 
 settings = get_settings()
 openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+async_openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
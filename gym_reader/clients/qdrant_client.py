@@ -1,4 +1,4 @@
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from gym_reader.settings import get_settings
 
 settings = get_settings()
@@ -19,9 +19,18 @@ class GymReaderQdrantClient:
             api_key=settings.QDRANT_API_KEY,
             port=settings.QDRANT_PORT,
         )
+        self.async_client = AsyncQdrantClient(
+            url=settings.QDRANT_URL,
+            api_key=settings.QDRANT_API_KEY,
+            port=settings.QDRANT_PORT,
+        )
 
     def get_client(self):
         return self.client
 
+    def get_async_client(self):
+        return self.async_client
+
 
 qdrant_client = GymReaderQdrantClient().get_client()
+async_qdrant_client = GymReaderQdrantClient().get_async_client()
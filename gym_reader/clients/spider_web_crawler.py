@@ -1,8 +1,14 @@
 from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
+import asyncio
+import hashlib
+import json
+import httpx
 import requests
 from gym_reader.settings import get_settings
 from gym_reader.logger import get_logger
+from gym_reader.clients.redis_client import redis_client
 
 log = get_logger(__name__)
 settings = get_settings()
@@ -24,6 +30,10 @@ class SpiderClient:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        # created lazily, so that it binds to the running event loop
+        self.async_client = None
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.cache_stats = {"hits": 0, "misses": 0}
 
     @retry(
         stop=stop_after_attempt(3),
@@ -55,6 +65,124 @@ class SpiderClient:
             log.error(f"Unexpected error in Spider search: {e}")
             raise
 
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self.async_client is None:
+            # a single pooled client, so connections to the API are kept alive
+            self.async_client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=60 * 5,
+                limits=httpx.Limits(
+                    max_connections=settings.SPIDER_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SPIDER_MAX_CONNECTIONS,
+                ),
+            )
+        return self.async_client
+
+    def _get_host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(
+                settings.SPIDER_MAX_CONCURRENCY_PER_HOST
+            )
+        return self.host_semaphores[host]
+
+    @staticmethod
+    def _cache_key(url: str, limit: int = 2) -> str:
+        return f"spider:url:{limit}:{hashlib.sha256(url.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _content_key(content_hash: str) -> str:
+        return f"spider:content:{content_hash}"
+
+    @staticmethod
+    def is_cacheable(search_result: List[Dict[str, Any]]) -> bool:
+        """
+        Empty responses and pages without content are transient failures as far as
+        indexing is concerned, so they must never be replayed from the cache.
+        """
+        return bool(search_result) and all(
+            isinstance(page, dict) and page.get("content") for page in search_result
+        )
+
+    @staticmethod
+    def content_hash(search_result: List[Dict[str, Any]]) -> str:
+        """
+        Hashes the crawled pages, so that unchanged content can be detected.
+        """
+        digest = hashlib.sha256()
+        for page in search_result:
+            digest.update(page.get("url", "").encode("utf-8"))
+            digest.update((page.get("content") or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        reraise=True,
+    )
+    async def _asearch_with_retry(
+        self, url: str, limit: int = 2
+    ) -> List[Dict[str, Any]]:
+        json_data = {"url": url, "limit": limit, "return_format": "markdown"}
+        async with self._get_host_semaphore(url):
+            response = await self._get_async_client().post(
+                self.base_url, json=json_data
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def _read_cache(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+        content_hash = redis_client.get(cache_key)
+        if content_hash is None:
+            return None
+        if isinstance(content_hash, bytes):
+            content_hash = content_hash.decode("utf-8")
+        cached = redis_client.get(self._content_key(content_hash))
+        return json.loads(cached) if cached is not None else None
+
+    def _write_cache(self, cache_key: str, search_result: List[Dict[str, Any]]):
+        content_hash = self.content_hash(search_result)
+        pipeline = redis_client.pipeline()
+        pipeline.set(
+            self._content_key(content_hash),
+            json.dumps(search_result),
+            ex=settings.SPIDER_CACHE_TTL_SECONDS,
+        )
+        pipeline.set(cache_key, content_hash, ex=settings.SPIDER_CACHE_TTL_SECONDS)
+        pipeline.execute()
+
+    async def asearch(
+        self, url: str, use_cache: bool = True, limit: int = 2
+    ) -> List[Dict[str, Any]]:
+        """
+        Perform a search using Spider API without blocking the event loop.
+
+        The cache is keyed by url and by content hash: the url maps to the hash of
+        its last response, and the response is stored under that hash, so urls
+        serving identical content share one entry. Entries live for
+        SPIDER_CACHE_TTL_SECONDS, and only responses with content are cached.
+        """
+        cache_key = self._cache_key(url, limit)
+        if use_cache:
+            try:
+                cached = await asyncio.to_thread(self._read_cache, cache_key)
+                if cached is not None:
+                    self.cache_stats["hits"] += 1
+                    log.debug(f"Spider cache hit for {url}")
+                    return cached
+            except Exception as e:
+                log.error(f"Error reading spider cache: {e}", exc_info=True)
+        self.cache_stats["misses"] += 1
+        result = await self._asearch_with_retry(url, limit)
+        if not self.is_cacheable(result):
+            log.warning(f"Spider returned no content for {url}, not caching it")
+            return result
+        try:
+            await asyncio.to_thread(self._write_cache, cache_key, result)
+        except Exception as e:
+            log.error(f"Error writing spider cache: {e}", exc_info=True)
+        return result
+
 
 # Create a single instance of SpiderClient
 spider_client = SpiderClient()
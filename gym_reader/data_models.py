@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import datetime
 from typing import List, Dict, Optional, Any
 from enum import Enum
 
@@ -10,10 +11,41 @@ class SearchResult(BaseModel):
     relevant_content: List[str]
 
 
+class CrawlerBackend(str, Enum):
+    SPIDER = "spider"
+    LOCAL = "local"
+
+
 class RepoConfig(BaseModel):
     base_branch: str
     search_paths: List[str]
     include_extensions: List[str]
+    crawler: CrawlerBackend = CrawlerBackend.SPIDER
+    # number of pages fetched per link: the page itself and its first children
+    crawl_limit: int = 2
+    # per repo overrides of the crawler backend
+    repo_crawlers: Dict[str, CrawlerBackend] = {}
+
+    def crawler_for(self, repo: str) -> CrawlerBackend:
+        return self.repo_crawlers.get(repo, self.crawler)
+
+
+class QuantizationType(str, Enum):
+    SCALAR = "scalar"
+    BINARY = "binary"
+
+
+class StorageProfile(BaseModel):
+    name: str
+    quantization: Optional[QuantizationType] = None
+    # keep the quantized vectors in RAM while the originals can live on disk
+    quantized_always_ram: bool = True
+    on_disk_vectors: bool = False
+    rescore: bool = True
+    oversampling: float = 2.0
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    hnsw_ef: Optional[int] = None
 
 
 class Library(str, Enum):
@@ -30,6 +62,43 @@ class PayloadForIndexing(BaseModel):
     parent_summary: str
     parent_title: str
     parent_keywords: List[str]
+    # cl100k tokens of parent_content when the extractor had to encode it, so the
+    # chunker does not encode it again; never serialized
+    parent_tokens: Optional[List[int]] = Field(default=None, exclude=True)
+
+
+class ChunkPayload(BaseModel):
+    # key of the document point that holds the document level fields
+    document_key: str
+    parent_link: str
+    parent_title: str
+    content: str
+    token_start: int
+    token_end: int
+
+
+class DocumentPayload(BaseModel):
+    document_key: str
+    parent_link: str
+    parent_title: str
+    parent_summary: str
+    parent_keywords: List[str]
+    child_links: List[str]
+    # zlib compressed, base64 encoded json list of the child page contents
+    child_contents_compressed: str
+
+
+class DeadLetteredDocument(BaseModel):
+    uuid: str
+    url: str
+    repo: str
+    attempt_count: int
+    last_error: Optional[str] = None
+    updated_at: datetime
+
+
+class RequeuePayload(BaseModel):
+    uuids: List[str]
 
 
 class Message(BaseModel):
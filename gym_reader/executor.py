@@ -0,0 +1,24 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from gym_reader.settings import get_settings
+
+settings = get_settings()
+
+# Bounded pool for blocking calls made from async code paths, such as dspy
+# predictions and synchronous Redis lookups, which have no async client.
+blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_EXECUTOR_WORKERS,
+    thread_name_prefix="gym-reader-blocking",
+)
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a blocking function in the bounded executor without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        blocking_executor, functools.partial(func, *args, **kwargs)
+    )
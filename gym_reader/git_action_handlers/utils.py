@@ -1,3 +1,4 @@
+import asyncio
 import json
 
 from gym_reader.logger import get_logger
@@ -7,19 +8,18 @@ from gym_reader.clients.github_client import (
     fetch_file_diff,
     fetch_file_content_at_commit,
 )
-from gym_reader.data_models import RepoConfig
+from gym_reader.repo_config import repo_config
 from gym_reader.agents.extractor_agent import ContentExtractorAgent
 from gym_reader.semantic_search.index import GymIndex
 from gym_reader.clients.qdrant_client import qdrant_client
 from gym_reader.clients.openai_client import openai_client
 from gym_reader.clients.meilisearch_client import meilisearch_client
 from gym_reader.clients.prisma_client import prisma_singleton
-import yaml
 import fnmatch
 import re
 from tqdm import tqdm
 from gym_db.gym_db.db_funcs import DbOps, enums
-
+from gym_reader.services.indexing_wakeup import notify_indexer
 
 # Create an Extractor Agent
 extractor_agent = ContentExtractorAgent()
@@ -27,12 +27,6 @@ extractor_agent = ContentExtractorAgent()
 gym_index = GymIndex(qdrant_client, meilisearch_client, openai_client)
 
 
-def read_config_file(file_path: str) -> RepoConfig:
-    with open(file_path) as file:
-        config = yaml.safe_load(file)
-    return RepoConfig(**config)
-
-
 async def get_dbops_client():
     prisma_client = await prisma_singleton.get_client()
     dbops = DbOps(prisma_client)
@@ -41,8 +35,6 @@ async def get_dbops_client():
 
 # A specific identifier for the comment
 settings = get_settings()
-config_file_path = settings.CONFIG_FILE_PATH
-repo_config = read_config_file(config_file_path)
 log = get_logger(__name__)
 
 
@@ -168,6 +160,9 @@ async def push_action_handler(payload, request):
 
     added_links = []
     deleted_links = []
+    existing_links = []
+    # the link lists are per file, this remembers whether any file changed links
+    has_changes = False
     for file_detail in file_details:
         if not any(
             fnmatch.fnmatch(file_detail["path"], pattern)
@@ -195,18 +190,25 @@ async def push_action_handler(payload, request):
 
         # get the added and deleted links from the file diff
         added_links, deleted_links = get_links_from_diff(file_diff)
+        # only links on lines the diff touched may have changed
+        changed_links = set(added_links)
 
         # if any deleted link is in added_link, remove it from the deleted_links
         deleted_links = [link for link in deleted_links if link not in added_links]
 
         # let's check which links are present and which are not
-        added_links = [
-            link
-            for link in all_links
-            if not await gym_index.check_if_link_exists(link, repo)
-        ]
+        added_links = []
+        existing_links = []
+        for link in all_links:
+            if await gym_index.check_if_link_exists(link, repo):
+                if link in changed_links:
+                    existing_links.append(link)
+            else:
+                added_links.append(link)
         log.debug(f"Added links: {added_links}")
         log.debug(f"Deleted links: {deleted_links}")
+        if added_links or deleted_links or existing_links:
+            has_changes = True
 
         # for added links, let's upsert the document to the database
         for added_link in tqdm(added_links, total=len(added_links)):
@@ -220,10 +222,28 @@ async def push_action_handler(payload, request):
             # No indexing logic here, just upsert the document
             # The indexing will be handled by the indexing service
 
+        # for indexed links the diff touched, mark them for an incremental refresh
+        for existing_link in existing_links:
+            try:
+                document_record = await dbops.get_document_record_by_url_and_repo(
+                    existing_link, repo
+                )
+                if document_record and document_record.is_indexed:
+                    await dbops.update_document_updated_status_by_uuid(
+                        document_record.uuid, True
+                    )
+            except Exception as e:
+                log.error(
+                    f"Error marking document {existing_link} for refresh: {e}",
+                    exc_info=True,
+                )
+
     try:
         if deleted_links:
             for deleted_link in deleted_links:
-                document_record = await dbops.get_document_record_by_url(deleted_link)
+                document_record = await dbops.get_document_record_by_url_and_repo(
+                    deleted_link, repo
+                )
                 if document_record:
                     await dbops.update_document_deleted_status_by_uuid(
                         document_record.uuid, True
@@ -234,4 +254,8 @@ async def push_action_handler(payload, request):
         log.error(f"Error deleting from qdrant collection: {e}", exc_info=True)
     log.debug(f"Added links: {added_links}")
     log.debug(f"Deleted links: {deleted_links}")
+    if has_changes:
+        # start indexing right away instead of waiting for the next poll, the
+        # redis publish is blocking so it runs off the event loop
+        await asyncio.to_thread(notify_indexer, repo, "push")
     return True
@@ -1,25 +1,50 @@
 import dspy
 from gym_reader.api.cache_tools import cache
 from gym_reader.logger import get_logger
+from gym_reader.executor import run_blocking
+from gym_reader.semantic_search.utils import get_encoding
 from tenacity import retry, stop_after_attempt, wait_random_exponential
-from instructor import Instructor
+from instructor import AsyncInstructor, Instructor
+from typing import Optional
+import copy
 import json
+import tiktoken
+from jiter import from_json
 
 log = get_logger(__name__)
 
 
 def add_tokens_to_cache(request_id: str, prediction_tokens: int):
-    token_till_now = cache.get(request_id)
-    if token_till_now is None:
-        log.debug(
-            f"setting token_till_now: {prediction_tokens} for request_id: {request_id}"
-        )
-        cache.set(request_id, prediction_tokens)
-    else:
-        log.debug(
-            f"updating token_till_now: {token_till_now} for request_id: {request_id}"
-        )
-        cache.set(request_id, token_till_now + prediction_tokens)
+    token_till_now = cache.incr(request_id, prediction_tokens)
+    log.debug(f"token_till_now: {token_till_now} for request_id: {request_id}")
+
+
+def _lm_for_call(lm):
+    """
+    dspy records usage only in the history of the LM, which is shared by concurrent
+    requests. Each prediction runs on a shallow copy with its own history, so the
+    usage read afterwards is the usage of that prediction.
+    """
+    call_lm = copy.copy(lm)
+    call_lm.history = []
+    return call_lm
+
+
+def predict_and_record_usage(predictor, model=None, request_id: str = None, **kwargs):
+    lm = model or dspy.settings.lm
+    call_lm = _lm_for_call(lm)
+    with dspy.context(lm=call_lm):
+        prediction = predictor(**kwargs)
+    # keep inspect_history working on the shared LM
+    lm.history.extend(call_lm.history)
+    try:
+        prediction_tokens = call_lm.history[-1]["response"]["usage"]["total_tokens"]
+    except Exception as e:
+        log.error(f"Error adding tokens to cache: {e}", exc_info=True)
+        return prediction
+    log.debug(f"prediction_tokens: {prediction_tokens} with request_id: {request_id}")
+    add_tokens_to_cache(request_id, prediction_tokens)
+    return prediction
 
 
 class TypedChainOfThoughtProgramme(dspy.Module):
@@ -28,35 +53,9 @@ class TypedChainOfThoughtProgramme(dspy.Module):
         self.predictor = dspy.TypedChainOfThought(signature)
 
     def forward(self, model=None, request_id: str = None, **kwargs):
-        if model:
-            with dspy.context(lm=model):
-                prediction = self.predictor(**kwargs)
-                try:
-                    prediction_tokens = model.history[-1]["response"]["usage"][
-                        "total_tokens"
-                    ]
-                    log.debug(
-                        f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
-                    )
-                    add_tokens_to_cache(request_id, prediction_tokens)
-                except Exception as e:
-                    log.error(f"Error adding tokens to cache: {e}", exc_info=True)
-            return prediction
-        else:
-            prediction = self.predictor(**kwargs)
-            model = dspy.settings.lm
-
-            try:
-                prediction_tokens = model.history[-1]["response"]["usage"][
-                    "total_tokens"
-                ]
-                log.debug(
-                    f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
-                )
-                add_tokens_to_cache(request_id, prediction_tokens)
-            except Exception as e:
-                log.error(f"Error adding tokens to cache: {e}", exc_info=True)
-            return prediction
+        return predict_and_record_usage(
+            self.predictor, model=model, request_id=request_id, **kwargs
+        )
 
 
 class TypedProgramme(dspy.Module):
@@ -65,83 +64,169 @@ class TypedProgramme(dspy.Module):
         self.predictor = dspy.Predict(signature)
 
     def forward(self, model=None, request_id: str = None, **kwargs):
-        if model:
-            with dspy.context(lm=model):
-                prediction = self.predictor(**kwargs)
-                try:
-                    prediction_tokens = model.history[-1]["response"]["usage"][
-                        "total_tokens"
-                    ]
-                    log.debug(
-                        f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
-                    )
-                    add_tokens_to_cache(request_id, prediction_tokens)
-                except Exception as e:
-                    log.error(f"Error adding tokens to cache: {e}", exc_info=True)
-                return prediction
-        else:
-            prediction = self.predictor(**kwargs)
-            model = dspy.settings.lm
-            try:
-                prediction_tokens = model.history[-1]["response"]["usage"][
-                    "total_tokens"
-                ]
-                log.debug(f"prediction_tokens: {prediction_tokens}")
-                add_tokens_to_cache(request_id, prediction_tokens)
-            except Exception as e:
-                log.error(f"Error adding tokens to cache: {e}", exc_info=True)
-            return prediction
+        return predict_and_record_usage(
+            self.predictor, model=model, request_id=request_id, **kwargs
+        )
 
 
 class InstructorProgramme:
-    def __init__(self, client_instructor: Instructor):
+    def __init__(
+        self,
+        client_instructor: Instructor,
+        async_client_instructor: Optional[AsyncInstructor] = None,
+    ):
         self.client_instructor = client_instructor
+        self.async_client_instructor = async_client_instructor
+
+    @staticmethod
+    def _completion_kwargs(model=None, **kwargs) -> dict:
+        return {
+            "model": model or "gpt-4o",
+            "messages": kwargs.get("messages"),
+            "temperature": kwargs.get("temperature", 0.2),
+            "seed": kwargs.get("seed", 123),
+            "top_p": kwargs.get("top_p", 1),
+            "max_tokens": kwargs.get("max_tokens", 4096),
+            "tools": kwargs.get("tools", None),
+            "function_call": kwargs.get("function_call", None),
+            "response_model": kwargs.get("response_model", None),
+        }
+
+    @staticmethod
+    def _parse_completion(completion, response_model, request_id: str = None):
+        log.debug(completion)
+        try:
+            prediction_tokens = completion.usage.total_tokens
+            log.debug(
+                f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
+            )
+            add_tokens_to_cache(request_id, prediction_tokens)
+        except Exception as e:
+            log.error(f"Error adding tokens to cache: {e}", exc_info=True)
+        # dump into pydantic model
+        return response_model(
+            **json.loads(completion.choices[0].message.tool_calls[0].function.arguments)
+        )
 
     @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(5))
     def forward(self, model=None, request_id: str = None, **kwargs):
-        if model is None:
-            model = "gpt-4o"
-
         try:
-            messages = kwargs.get("messages")
-            temperature = kwargs.get("temperature", 0.2)
-            seed = kwargs.get("seed", 123)
-            top_p = kwargs.get("top_p", 1)
-            max_tokens = kwargs.get("max_tokens", 4096)
-            tools = kwargs.get("tools", None)
-            function_call = kwargs.get("function_call", None)
-            response_model = kwargs.get("response_model", None)
+            completion_kwargs = self._completion_kwargs(model, **kwargs)
             user, completion = (
                 self.client_instructor.chat.completions.create_with_completion(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    seed=seed,
-                    top_p=top_p,
-                    max_tokens=max_tokens,
-                    tools=tools,
-                    function_call=function_call,
-                    response_model=response_model,
+                    **completion_kwargs
                 )
             )
+            return self._parse_completion(
+                completion, completion_kwargs["response_model"], request_id
+            )
+        except Exception as e:
+            log.exception("Unable to generate ChatCompletion response")
+            log.error(f"Exception: {e}")
+            return None
 
-            log.debug(completion)
-            try:
-                prediction_tokens = completion.usage.total_tokens
-                log.debug(
-                    f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
-                )
-                add_tokens_to_cache(request_id, prediction_tokens)
-            except Exception as e:
-                log.error(f"Error adding tokens to cache: {e}", exc_info=True)
-            # dump into pydantic model
-            response = response_model(
-                **json.loads(
-                    completion.choices[0].message.tool_calls[0].function.arguments
+    @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(5))
+    async def aforward(self, model=None, request_id: str = None, **kwargs):
+        """
+        Same as forward, but awaits the completion on the async client, so the
+        event loop stays free while the model is generating.
+        """
+        if self.async_client_instructor is None:
+            return await run_blocking(
+                self.forward, model=model, request_id=request_id, **kwargs
+            )
+        try:
+            completion_kwargs = self._completion_kwargs(model, **kwargs)
+            user, completion = (
+                await self.async_client_instructor.chat.completions.create_with_completion(
+                    **completion_kwargs
                 )
             )
-            return response
+            return self._parse_completion(
+                completion, completion_kwargs["response_model"], request_id
+            )
         except Exception as e:
             log.exception("Unable to generate ChatCompletion response")
             log.error(f"Exception: {e}")
             return None
+
+    @staticmethod
+    def _estimate_prompt_tokens(model: str, messages, tool: dict) -> int:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = get_encoding("o200k_base")
+        # every message carries a few tokens of framing besides its content
+        return sum(
+            4 + len(encoding.encode(str(message.get("content", ""))))
+            for message in messages
+        ) + len(encoding.encode(json.dumps(tool)))
+
+    async def astream(self, model=None, request_id: str = None, **kwargs):
+        """
+        Streams the arguments of the response model as they are generated.
+
+        The completion is requested with include_usage, so the request is charged
+        the usage OpenAI reports in the final chunk. Only when the stream is cut
+        short before that chunk is the usage estimated.
+
+        Yields:
+            dict: The arguments parsed so far, the last one being complete.
+        """
+        if self.async_client_instructor is None:
+            response = await self.aforward(model=model, request_id=request_id, **kwargs)
+            if response is not None:
+                yield response.model_dump()
+            return
+        completion_kwargs = self._completion_kwargs(model, **kwargs)
+        tool = completion_kwargs["response_model"].openai_schema
+        stream = await self.async_client_instructor.client.chat.completions.create(
+            model=completion_kwargs["model"],
+            messages=completion_kwargs["messages"],
+            temperature=completion_kwargs["temperature"],
+            seed=completion_kwargs["seed"],
+            top_p=completion_kwargs["top_p"],
+            max_tokens=completion_kwargs["max_tokens"],
+            tools=[{"type": "function", "function": tool}],
+            tool_choice={"type": "function", "function": {"name": tool["name"]}},
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        arguments = ""
+        completion_chunks = 0
+        usage = None
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                    continue
+                delta = chunk.choices[0].delta.tool_calls[0].function.arguments
+                if not delta:
+                    continue
+                completion_chunks += 1
+                arguments += delta
+                try:
+                    yield from_json(
+                        arguments.encode("utf-8"), partial_mode="trailing-strings"
+                    )
+                except ValueError:
+                    continue
+        finally:
+            if usage is not None:
+                prediction_tokens = usage.total_tokens
+            else:
+                # cut short before the usage chunk: estimate the prompt and count
+                # every received chunk as one completion token
+                prediction_tokens = (
+                    self._estimate_prompt_tokens(
+                        completion_kwargs["model"], completion_kwargs["messages"], tool
+                    )
+                    + completion_chunks
+                )
+            log.debug(
+                f"prediction_tokens: {prediction_tokens} with request_id: {request_id}"
+            )
+            # recorded before closing, so that the charge does not depend on it
+            add_tokens_to_cache(request_id, prediction_tokens)
+            await stream.close()
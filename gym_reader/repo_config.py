@@ -0,0 +1,15 @@
+import yaml
+from gym_reader.data_models import RepoConfig
+from gym_reader.settings import get_settings
+
+settings = get_settings()
+
+
+def read_config_file(file_path: str) -> RepoConfig:
+    with open(file_path) as file:
+        config = yaml.safe_load(file)
+    return RepoConfig(**config)
+
+
+# Loaded once, importing this module builds no clients or agents
+repo_config = read_config_file(settings.CONFIG_FILE_PATH)
@@ -0,0 +1,143 @@
+import hashlib
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from cachetools import LRUCache
+from gym_reader.clients.redis_client import redis_client
+from gym_reader.logger import get_logger
+from gym_reader.settings import get_settings
+
+log = get_logger(__name__)
+settings = get_settings()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (text hash, model, dimension, provider).
+
+    It has two tiers: an in-process LRU and a durable Redis tier. Both hold the packed
+    float32 bytes, about 6 KB for 1536 dimensions against about 50 KB as a list of
+    Python floats, and embeddings are unpacked on read. The Redis tier keeps
+    a sorted set of keys scored by last access, and evicts the least recently used
+    entries once it grows past the configured number of entries.
+    """
+
+    _instance = None
+    KEY_PREFIX = "embedding_cache"
+    LRU_KEY = "embedding_cache:lru"
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.enabled = settings.EMBEDDING_CACHE_ENABLED
+        self.memory = LRUCache(maxsize=settings.EMBEDDING_CACHE_MEMORY_MAX_ENTRIES)
+        self.redis_max_entries = settings.EMBEDDING_CACHE_REDIS_MAX_ENTRIES
+        self.redis = redis_client
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def make_key(
+        self, text: str, model: str, dimension: Optional[int], provider: str
+    ) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{provider}:{model}:{dimension}:{text_hash}"
+
+    @staticmethod
+    def _pack(embedding: List[float]) -> bytes:
+        return struct.pack(f"{len(embedding)}f", *embedding)
+
+    @staticmethod
+    def _unpack(value: bytes) -> List[float]:
+        return list(struct.unpack(f"{len(value) // 4}f", value))
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Looks up the given keys, first in memory and then in Redis.
+
+        Returns:
+            Dict[str, List[float]]: The embeddings that were found, by key.
+        """
+        if not self.enabled:
+            return {}
+        packed = {}
+        remaining = []
+        with self._lock:
+            for key in keys:
+                value = self.memory.get(key)
+                if value is not None:
+                    packed[key] = value
+                    self.stats["memory_hits"] += 1
+                else:
+                    remaining.append(key)
+        if remaining:
+            try:
+                values = self.redis.mget(remaining)
+                hits = {
+                    key: value
+                    for key, value in zip(remaining, values)
+                    if value is not None
+                }
+                if hits:
+                    # refresh the recency of the keys we just read
+                    now = time.time()
+                    self.redis.zadd(self.LRU_KEY, {key: now for key in hits})
+                with self._lock:
+                    self.memory.update(hits)
+                packed.update(hits)
+            except Exception as e:
+                log.error(f"Error reading embedding cache: {e}", exc_info=True)
+        found = {key: self._unpack(value) for key, value in packed.items()}
+        with self._lock:
+            self.stats["redis_hits"] += len(found) - (len(keys) - len(remaining))
+            self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: List[Tuple[str, List[float]]]):
+        if not self.enabled or not items:
+            return
+        packed = [(key, self._pack(embedding)) for key, embedding in items]
+        with self._lock:
+            self.memory.update(packed)
+        try:
+            now = time.time()
+            pipeline = self.redis.pipeline()
+            for key, value in packed:
+                pipeline.set(key, value)
+            pipeline.zadd(self.LRU_KEY, {key: now for key, _ in items})
+            pipeline.execute()
+            self._evict()
+        except Exception as e:
+            log.error(f"Error writing embedding cache: {e}", exc_info=True)
+
+    def _evict(self):
+        overflow = self.redis.zcard(self.LRU_KEY) - self.redis_max_entries
+        if overflow <= 0:
+            return
+        evicted = [key for key, _ in self.redis.zpopmin(self.LRU_KEY, overflow)]
+        if evicted:
+            self.redis.delete(*evicted)
+            with self._lock:
+                self.stats["evictions"] += len(evicted)
+            log.debug(f"Evicted {len(evicted)} embeddings from the cache")
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+
+embedding_cache = EmbeddingCache()
@@ -1,10 +1,23 @@
 from gym_reader.semantic_search.preprocessor import (
     Preprocessor,
 )  # Import the Preprocessor class
-from qdrant_client import QdrantClient, models  # Imported models
+from qdrant_client import AsyncQdrantClient, QdrantClient, models  # Imported models
 from meilisearch import Client as MeilisearchClient
 from gym_reader.data_models import SearchResult
-from openai import OpenAI
+from gym_reader.semantic_search.schema_registry import schema_registry
+from gym_reader.semantic_search.storage_profiles import (
+    get_storage_profile,
+    search_params,
+)
+from gym_reader.executor import run_blocking
+from openai import AsyncOpenAI, OpenAI
+from gym_reader.settings import get_settings
+from cachetools import TTLCache
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import threading
+
+settings = get_settings()
 
 
 class HybridSearch(Preprocessor):  # Inherit from Preprocessor
@@ -13,60 +26,371 @@ class HybridSearch(Preprocessor):  # Inherit from Preprocessor
         qdrant_client: QdrantClient,
         meilisearch_client: MeilisearchClient,
         openai_client: OpenAI,
+        async_qdrant_client: Optional[AsyncQdrantClient] = None,
+        async_openai_client: Optional[AsyncOpenAI] = None,
     ):
-        super().__init__(qdrant_client, meilisearch_client, openai_client)
+        super().__init__(
+            qdrant_client, meilisearch_client, openai_client, async_openai_client
+        )
+        # used by the async search path, which falls back to the blocking client
+        # in the bounded executor when it is not given
+        self.async_qdrant_client = async_qdrant_client
+        # popular questions repeat, so their embeddings are kept in process for a while
+        self.query_embedding_cache = TTLCache(
+            maxsize=settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+        )
+        self._query_embedding_lock = threading.Lock()
+        self.query_embedding_stats = {"hits": 0, "misses": 0}
+
+    def _query_embedding_keys(
+        self, query: str, specs: List[Tuple[str, Optional[int]]]
+    ) -> List[tuple]:
+        return [
+            (
+                query,
+                self.embedding_model_for(provider),
+                dimension or self.embedding_dimension_for(provider),
+                provider,
+            )
+            for provider, dimension in specs
+        ]
+
+    def _get_cached_query_embedding(self, key: tuple) -> Optional[List[float]]:
+        with self._query_embedding_lock:
+            embedding = self.query_embedding_cache.get(key)
+        if embedding is not None:
+            self.query_embedding_stats["hits"] += 1
+        else:
+            self.query_embedding_stats["misses"] += 1
+        return embedding
+
+    def _set_cached_query_embedding(self, key: tuple, embedding: List[float]):
+        with self._query_embedding_lock:
+            self.query_embedding_cache[key] = embedding
+
+    def get_query_embeddings(
+        self, query: str, specs: List[Tuple[str, Optional[int]]]
+    ) -> List[List[float]]:
+        """
+        Embeds the query once per distinct (model, dimension, provider).
+
+        Args:
+            query (str): The search query.
+            specs (List[Tuple[str, Optional[int]]]): (provider, dimension) pairs.
+
+        Returns:
+            List[List[float]]: The embedding for each spec, in order.
+        """
+        keys = self._query_embedding_keys(query, specs)
+        embeddings: Dict[tuple, List[float]] = {}
+        for key in dict.fromkeys(keys):
+            embedding = self._get_cached_query_embedding(key)
+            if embedding is None:
+                text, model, dimension, provider = key
+                embedding = self.get_embedding(
+                    text, model=model, dimension=dimension, provider=provider
+                )
+                self._set_cached_query_embedding(key, embedding)
+            embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    async def aget_query_embeddings(
+        self, query: str, specs: List[Tuple[str, Optional[int]]]
+    ) -> List[List[float]]:
+        """
+        Async variant of get_query_embeddings, the distinct misses are embedded
+        concurrently.
+        """
+        keys = self._query_embedding_keys(query, specs)
+        embeddings: Dict[tuple, List[float]] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            embedding = self._get_cached_query_embedding(key)
+            if embedding is None:
+                missing.append(key)
+            else:
+                embeddings[key] = embedding
+        computed = await asyncio.gather(
+            *(
+                self.aget_embedding(
+                    text, model=model, dimension=dimension, provider=provider
+                )
+                for text, model, dimension, provider in missing
+            )
+        )
+        for key, embedding in zip(missing, computed):
+            self._set_cached_query_embedding(key, embedding)
+            embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    def _default_query_embedding_specs(self) -> List[Tuple[str, Optional[int]]]:
+        # with the default providers both vectors are the same embedding
+        return [
+            (
+                self.default_embedding_provider_for_summary,
+                self.default_embedding_dimension_for_summary,
+            ),
+            (
+                self.default_embedding_provider_for_content,
+                self.default_embedding_dimension_for_content,
+            ),
+        ]
 
     def search(self, query: str, collection_name: str, limit: int = 3) -> SearchResult:
         results = self.search_from_collection(query, collection_name, limit)
         self.logger.debug(results)
-        # parent link content
+        summaries = self.hydrate_summaries(results.points, collection_name)
+        return self._build_search_result(results.points, summaries)
+
+    async def asearch(
+        self, query: str, collection_name: str, limit: int = 3
+    ) -> SearchResult:
+        results = await self.asearch_from_collection(query, collection_name, limit)
+        self.logger.debug(results)
+        summaries = await self.ahydrate_summaries(results.points, collection_name)
+        return self._build_search_result(results.points, summaries)
+
+    @staticmethod
+    def _build_search_result(points, summaries: List[str]) -> SearchResult:
         return SearchResult(
             summary=[
-                {result.payload["parent_link"]: result.payload["parent_summary"]}
-                for result in results.points
+                {result.payload["parent_link"]: summary}
+                for result, summary in zip(points, summaries)
             ],
-            content_score=[result.score for result in results.points],
-            summary_score=[result.score for result in results.points],
+            content_score=[result.score for result in points],
+            summary_score=[result.score for result in points],
             relevant_content=[
-                result.payload["parent_content"] for result in results.points
+                result.payload.get("content", result.payload.get("parent_content"))
+                for result in points
             ],
         )
 
-    def search_from_collection(
-        self,
-        query: str,
-        collection_name: str,
-        limit: int = 3,
-        score_threshold: float = 0.5,
-    ):
-        summary_embedding = self.get_embedding(
-            query,
-            dimension=self.default_embedding_dimension_for_summary,
-            provider=self.default_embedding_provider_for_summary,
-        )
-        content_embedding = self.get_embedding(
-            query,
-            dimension=self.default_embedding_dimension_for_content,
-            provider=self.default_embedding_provider_for_content,
+    def _summaries_request(self, points, collection_name: str) -> Dict[str, Any]:
+        document_keys = list(
+            {
+                point.payload["document_key"]
+                for point in points
+                if "document_key" in point.payload
+            }
         )
-        results = self.qdrant_client.query_points(
-            collection_name,
-            prefetch=[
+        return {
+            "collection_name": self.document_collection_name(collection_name),
+            "ids": document_keys,
+            "with_payload": ["parent_summary"],
+        }
+
+    @staticmethod
+    def _summaries_from_documents(points, documents) -> List[str]:
+        summary_by_key = {
+            str(document.id): document.payload["parent_summary"]
+            for document in documents
+        }
+        return [
+            summary_by_key.get(
+                point.payload.get("document_key"),
+                point.payload.get("parent_summary", ""),
+            )
+            for point in points
+        ]
+
+    def hydrate_summaries(self, points, collection_name: str) -> list[str]:
+        """
+        Fetches the document summaries of the final top-k points only, in one call.
+        Points written before payloads were slimmed still carry their summary.
+        """
+        request = self._summaries_request(points, collection_name)
+        documents = []
+        if request["ids"]:
+            documents = self.qdrant_client.retrieve(**request)
+        return self._summaries_from_documents(points, documents)
+
+    async def ahydrate_summaries(self, points, collection_name: str) -> list[str]:
+        request = self._summaries_request(points, collection_name)
+        documents = []
+        if request["ids"]:
+            if self.async_qdrant_client is not None:
+                documents = await self.async_qdrant_client.retrieve(**request)
+            else:
+                documents = await run_blocking(self.qdrant_client.retrieve, **request)
+        return self._summaries_from_documents(points, documents)
+
+    @staticmethod
+    def _legacy_query(
+        collection_name: str,
+        summary_embedding: List[float],
+        content_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        params,
+    ) -> Dict[str, Any]:
+        # collections indexed before the two tier layout keep both vectors per chunk
+        return {
+            "collection_name": collection_name,
+            "prefetch": [
                 models.Prefetch(
                     query=summary_embedding,
                     using="summary",
                     limit=limit,
                     score_threshold=score_threshold,
+                    params=params,
                 ),
                 models.Prefetch(
                     query=content_embedding,
                     using="content",
                     limit=limit,
                     score_threshold=score_threshold,
+                    params=params,
                 ),
             ],
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=limit,
-            score_threshold=score_threshold,
+            "query": models.FusionQuery(fusion=models.Fusion.RRF),
+            "limit": limit,
+            "score_threshold": score_threshold,
+        }
+
+    @staticmethod
+    def _document_query(
+        document_collection_name: str,
+        summary_embedding: List[float],
+        score_threshold: float,
+        params,
+    ) -> Dict[str, Any]:
+        # Document tier first: find the documents whose summary matches the query
+        return {
+            "collection_name": document_collection_name,
+            "query": summary_embedding,
+            "using": "summary",
+            "limit": settings.SEARCH_DOCUMENT_CANDIDATES,
+            "score_threshold": score_threshold,
+            "search_params": params,
+            "with_payload": False,
+        }
+
+    def _chunk_query(
+        self,
+        collection_name: str,
+        documents,
+        content_embedding: List[float],
+        limit: int,
+        score_threshold: float,
+        params,
+    ) -> Dict[str, Any]:
+        document_keys = [str(document.id) for document in documents.points]
+        self.logger.debug(f"Document candidates: {document_keys}")
+        # Then score only the chunks of the winning documents. When no document
+        # passes the threshold, search all chunks so content matches are not lost.
+        # Chunks written before the two tier layout have no document_key and no
+        # document point, so they stay searchable until their link is re-indexed.
+        chunk_filter = None
+        if document_keys:
+            chunk_filter = models.Filter(
+                should=[
+                    models.FieldCondition(
+                        key="document_key", match=models.MatchAny(any=document_keys)
+                    ),
+                    models.IsEmptyCondition(
+                        is_empty=models.PayloadField(key="document_key")
+                    ),
+                ]
+            )
+        return {
+            "collection_name": collection_name,
+            "query": content_embedding,
+            "using": "content",
+            "query_filter": chunk_filter,
+            "limit": limit,
+            "score_threshold": score_threshold,
+            "search_params": params,
+        }
+
+    def search_from_collection(
+        self,
+        query: str,
+        collection_name: str,
+        limit: int = 3,
+        score_threshold: float = 0.5,
+    ):
+        summary_embedding, content_embedding = self.get_query_embeddings(
+            query, self._default_query_embedding_specs()
+        )
+        params = search_params(get_storage_profile(collection_name))
+        document_collection_name = self.document_collection_name(collection_name)
+        if not schema_registry.qdrant_collection_exists(document_collection_name):
+            return self.qdrant_client.query_points(
+                **self._legacy_query(
+                    collection_name,
+                    summary_embedding,
+                    content_embedding,
+                    limit,
+                    score_threshold,
+                    params,
+                )
+            )
+        documents = self.qdrant_client.query_points(
+            **self._document_query(
+                document_collection_name, summary_embedding, score_threshold, params
+            )
+        )
+        return self.qdrant_client.query_points(
+            **self._chunk_query(
+                collection_name,
+                documents,
+                content_embedding,
+                limit,
+                score_threshold,
+                params,
+            )
+        )
+
+    async def _aquery_points(self, **request):
+        if self.async_qdrant_client is not None:
+            return await self.async_qdrant_client.query_points(**request)
+        return await run_blocking(self.qdrant_client.query_points, **request)
+
+    async def asearch_from_collection(
+        self,
+        query: str,
+        collection_name: str,
+        limit: int = 3,
+        score_threshold: float = 0.5,
+    ):
+        """
+        Async variant of search_from_collection, it never blocks the event loop.
+        """
+        summary_embedding, content_embedding = await self.aget_query_embeddings(
+            query, self._default_query_embedding_specs()
+        )
+        # the selected profiles are refreshed from Redis once their cache expires
+        profile = await run_blocking(get_storage_profile, collection_name)
+        params = search_params(profile)
+        document_collection_name = self.document_collection_name(collection_name)
+        # positive results are cached, so this only reaches Qdrant for legacy layouts
+        document_collection_exists = await run_blocking(
+            schema_registry.qdrant_collection_exists, document_collection_name
+        )
+        if not document_collection_exists:
+            return await self._aquery_points(
+                **self._legacy_query(
+                    collection_name,
+                    summary_embedding,
+                    content_embedding,
+                    limit,
+                    score_threshold,
+                    params,
+                )
+            )
+        documents = await self._aquery_points(
+            **self._document_query(
+                document_collection_name, summary_embedding, score_threshold, params
+            )
+        )
+        return await self._aquery_points(
+            **self._chunk_query(
+                collection_name,
+                documents,
+                content_embedding,
+                limit,
+                score_threshold,
+                params,
+            )
         )
-        return results
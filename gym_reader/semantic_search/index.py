@@ -1,17 +1,25 @@
 from qdrant_client import QdrantClient
 from meilisearch import Client as MeilisearchClient
 from qdrant_client import models
-from gym_reader.data_models import PayloadForIndexing
+from gym_reader.data_models import ChunkPayload, DocumentPayload, PayloadForIndexing
 from openai import OpenAI
 from gym_reader.logger import get_logger
 from gym_reader.semantic_search.preprocessor import (
     Preprocessor,
 )  # Import the new Preprocessor class
 from gym_reader.semantic_search.utils import (
-    chunk_text_with_overlap,
+    TokenChunk,
+    TokenizedDocument,
+    compress_json,
 )  # Import the chunking utility
-import uuid  # Import the uuid module for generating random UUIDs
+import uuid  # Import the uuid module for generating deterministic point ids
+import hashlib
+import json
+from concurrent.futures import Future
+from typing import Optional
 from gym_reader.settings import get_settings
+from gym_reader.semantic_search.meilisearch_writer import meilisearch_writer
+from gym_reader.semantic_search.schema_registry import schema_registry
 
 config = get_settings()
 log = get_logger(__name__)
@@ -27,158 +35,333 @@ class GymIndex(Preprocessor):
         super().__init__(
             qdrant_client, meilisearch_client, openai_client
         )  # Initialize Preprocessor
+        self.meilisearch_writer = meilisearch_writer
+        # Counters to check how many embeddings were saved by deduplication
+        self.embedding_stats = {"requested": 0, "reused": 0}
+
+    def embed_distinct(
+        self,
+        texts: list[str],
+        dimension: int,
+        provider: str,
+        token_counts: Optional[list[Optional[int]]] = None,
+    ) -> list[list[float]]:
+        """
+        Embeds every distinct text exactly once and reuses the vector for duplicates.
+
+        Args:
+            texts (list[str]): The texts to embed, duplicates allowed.
+            dimension (int): The output dimension of the embeddings.
+            provider (str): The embedding provider.
+            token_counts (Optional[list[Optional[int]]]): Known token counts, if any.
+
+        Returns:
+            list[list[float]]: The embeddings, aligned with the input texts.
+        """
+        if token_counts is None:
+            token_counts = [None] * len(texts)
+        token_count_by_text = dict(zip(texts, token_counts))
+        distinct_texts = list(token_count_by_text)
+        embeddings = self.get_embeddings(
+            distinct_texts,
+            dimension=dimension,
+            provider=provider,
+            token_counts=[token_count_by_text[text] for text in distinct_texts],
+        )
+        self.embedding_stats["requested"] += len(distinct_texts)
+        self.embedding_stats["reused"] += len(texts) - len(distinct_texts)
+        embedding_by_text = dict(zip(distinct_texts, embeddings))
+        return [embedding_by_text[text] for text in texts]
 
     def add_to_qdrant_collection(self, data: PayloadForIndexing, collection_name: str):
-        existing_collections = [
-            collection.name
-            for collection in self.qdrant_client.get_collections().collections
-        ]
-        if collection_name not in existing_collections:
-            # create collection with default params
-            self.qdrant_client.create_collection(
-                collection_name=collection_name,
-                vectors_config={
-                    "summary": models.VectorParams(
-                        size=self.default_embedding_dimension_for_summary,
-                        distance=models.Distance.COSINE,
-                    ),
-                    "content": models.VectorParams(
-                        size=self.default_embedding_dimension_for_content,
-                        distance=models.Distance.COSINE,
-                    ),
-                },
-            )
-            try:
-                # we will create a payload index for "parent_link" so that we can easily delete by this field
-                self.qdrant_client.create_payload_index(
-                    collection_name=collection_name,
-                    field_name="parent_link",
-                    field_schema="keyword",  # Create a keyword based schem on the parent_link field
-                )
-            except Exception as e:
-                log.error(f"Error creating payload index: {e}", exc_info=True)
-                raise e
-        # Chunk only the parent_content using the external utility
-        content_chunks = chunk_text_with_overlap(
-            data.parent_content,
-            max_tokens=config.MAX_TOKENS_PER_CHUNK,
-            overlap=config.OVERLAP_TOKENS_PER_CHUNK,
-        )
-        log.info(f"Chunked into {len(content_chunks)} chunks")
-        points = []
+        points, stale_point_ids, document_point = self.prepare_qdrant_points(
+            data, collection_name
+        )
+        self.upsert_qdrant_points(points, collection_name, stale_point_ids)
+        return self.upsert_document_point(document_point, collection_name)
 
-        for chunk in content_chunks:
-            # Refactor data according to chunk
-            chunk_data = data.model_copy()
-            # Reset the parent_content to the chunk
-            chunk_data.parent_content = chunk
-            point_id = str(uuid.uuid4())  # Generate a random UUID for point_id
-            points.append(
-                models.PointStruct(
-                    id=point_id,
-                    vector={
-                        "summary": self.get_embedding(data.parent_summary),
-                        "content": self.get_embedding(chunk),
-                    },
-                    payload=chunk_data.model_dump(),  # All other properties remain the same
-                )
-            )
+    def ensure_qdrant_collection(self, collection_name: str):
+        # parent_link lets us delete by link, document_key lets the search restrict
+        # chunks to the winning documents
+        schema_registry.ensure_qdrant_collection(
+            collection_name,
+            {"content": self.default_embedding_dimension_for_content},
+            payload_indexes=["parent_link", "document_key"],
+            profile_name=collection_name,
+        )
+        # the document tier holds one summary vector per document
+        schema_registry.ensure_qdrant_collection(
+            self.document_collection_name(collection_name),
+            {"summary": self.default_embedding_dimension_for_summary},
+            payload_indexes=["parent_link"],
+            profile_name=collection_name,
+        )
+
+    def upsert_document_point(
+        self, document_point: models.PointStruct, collection_name: str
+    ):
+        """
+        Stores the document level fields and the summary vector once per document,
+        instead of on every chunk point.
+        """
         try:
-            self.qdrant_client.upsert(collection_name=collection_name, points=points)
+            self.qdrant_client.upsert(
+                collection_name=self.document_collection_name(collection_name),
+                points=[document_point],
+            )
             return True
         except Exception as e:
-            log.error(f"Error adding to qdrant collection: {e}", exc_info=True)
+            log.error(f"Error adding document to qdrant: {e}", exc_info=True)
             raise e
 
-    def delete_from_qdrant_collection(self, links: list[str], collection_name: str):
-        try:
+    @staticmethod
+    def chunk_point_id(collection_name: str, parent_link: str, chunk: str) -> str:
+        """
+        Derives a stable point id from the repo, the parent link and the chunk content,
+        so that re-indexing the same chunk always maps to the same point.
+        """
+        chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        name = f"{collection_name}:{parent_link}:{chunk_hash}"
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+    def get_existing_content_vectors(
+        self, link: str, collection_name: str
+    ) -> dict[str, list[float]]:
+        """
+        Returns the content vectors already indexed for a link, keyed by point id.
+        """
+        if not schema_registry.qdrant_collection_exists(collection_name):
+            return {}
+        existing = {}
+        offset = None
+        while True:
             results, offset = self.qdrant_client.scroll(
                 collection_name=collection_name,
                 scroll_filter=models.Filter(
-                    should=[
+                    must=[
                         models.FieldCondition(
-                            key="parent_link", match=models.MatchAny(any=links)
+                            key="parent_link", match=models.MatchValue(value=link)
                         )
                     ]
                 ),
                 limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=["content"],
             )
-            # get the point ids
-            point_ids = [result.id for result in results]
-            # delete the points
-            try:
+            for result in results:
+                existing[str(result.id)] = result.vector["content"]
+            if offset is None:
+                return existing
+
+    def prepare_qdrant_points(
+        self, data: PayloadForIndexing, collection_name: str
+    ) -> tuple[list[models.PointStruct], list[str], models.PointStruct]:
+        """
+        Diffs the chunks of a document against what the collection already holds.
+
+        Returns:
+            tuple[list[models.PointStruct], list[str], models.PointStruct]: The chunk
+            points to upsert, the ids of the points whose chunks disappeared from the
+            document, and the document point.
+        """
+        existing_content_vectors = self.get_existing_content_vectors(
+            data.parent_link, collection_name
+        )
+        points, document_point = self.build_qdrant_points(
+            data, collection_name, existing_content_vectors
+        )
+        stale_point_ids = list(
+            set(existing_content_vectors) - {point.id for point in points}
+        )
+        kept = len(existing_content_vectors) - len(stale_point_ids)
+        log.info(
+            f"{data.parent_link}: {len(points)} chunks, {len(points) - kept} new, "
+            f"{len(stale_point_ids)} stale"
+        )
+        return points, stale_point_ids, document_point
+
+    def build_qdrant_points(
+        self,
+        data: PayloadForIndexing,
+        collection_name: str,
+        existing_content_vectors: Optional[dict[str, list[float]]] = None,
+    ) -> tuple[list[models.PointStruct], models.PointStruct]:
+        if existing_content_vectors is None:
+            existing_content_vectors = {}
+        # Tokenize the parent_content once and slice the chunks from the tokens
+        if data.parent_tokens is not None:
+            document = TokenizedDocument.from_tokens(data.parent_tokens, self.tokenizer)
+        else:
+            document = TokenizedDocument(data.parent_content, self.tokenizer)
+        # Identical chunks map to the same point, so keep only the first of each
+        chunks_by_id: dict[str, TokenChunk] = {}
+        max_tokens = self.max_chunk_tokens_for(
+            self.default_embedding_provider_for_content
+        )
+        for chunk in document.iter_chunks(
+            max_tokens=max_tokens,
+            overlap=min(config.OVERLAP_TOKENS_PER_CHUNK, max_tokens // 4),
+        ):
+            point_id = self.chunk_point_id(
+                collection_name, data.parent_link, chunk.text
+            )
+            chunks_by_id.setdefault(point_id, chunk)
+        log.info(
+            f"Chunked {document.token_count} tokens into {len(chunks_by_id)} chunks"
+        )
+        # Chunks that are already indexed keep their content vector
+        new_chunks = [
+            chunk
+            for point_id, chunk in chunks_by_id.items()
+            if point_id not in existing_content_vectors
+        ]
+        new_chunk_texts = [chunk.text for chunk in new_chunks]
+        new_chunk_token_counts = [chunk.token_count for chunk in new_chunks]
+        self.embedding_stats["reused"] += len(chunks_by_id) - len(new_chunks)
+        # Embed every distinct text of the document once, in as few requests as possible.
+        # When summary and content share a provider and dimension they go in the same batch.
+        summary_key = (
+            self.default_embedding_provider_for_summary,
+            self.default_embedding_dimension_for_summary,
+        )
+        content_key = (
+            self.default_embedding_provider_for_content,
+            self.default_embedding_dimension_for_content,
+        )
+        if summary_key == content_key:
+            embeddings = self.embed_distinct(
+                [data.parent_summary] + new_chunk_texts,
+                dimension=self.default_embedding_dimension_for_content,
+                provider=self.default_embedding_provider_for_content,
+                token_counts=[None] + new_chunk_token_counts,
+            )
+            summary_embedding, new_content_embeddings = embeddings[0], embeddings[1:]
+        else:
+            summary_embedding = self.embed_distinct(
+                [data.parent_summary],
+                dimension=self.default_embedding_dimension_for_summary,
+                provider=self.default_embedding_provider_for_summary,
+            )[0]
+            new_content_embeddings = self.embed_distinct(
+                new_chunk_texts,
+                dimension=self.default_embedding_dimension_for_content,
+                provider=self.default_embedding_provider_for_content,
+                token_counts=new_chunk_token_counts,
+            )
+        content_embedding_by_chunk = dict(zip(new_chunk_texts, new_content_embeddings))
+        log.info(
+            f"Embeddings requested: {self.embedding_stats['requested']}, "
+            f"reused: {self.embedding_stats['reused']}"
+        )
+        document_key = self.document_key(collection_name, data.parent_link)
+        points = []
+
+        for point_id, chunk in chunks_by_id.items():
+            # Chunk points only carry the chunk and a small header, the document
+            # level fields live on the document point
+            chunk_payload = ChunkPayload(
+                document_key=document_key,
+                parent_link=data.parent_link,
+                parent_title=data.parent_title,
+                content=chunk.text,
+                token_start=chunk.start,
+                token_end=chunk.end,
+            )
+            content_embedding = existing_content_vectors.get(point_id)
+            if content_embedding is None:
+                content_embedding = content_embedding_by_chunk[chunk.text]
+            points.append(
+                models.PointStruct(
+                    id=point_id,
+                    vector={"content": content_embedding},
+                    payload=chunk_payload.model_dump(),
+                )
+            )
+        document_payload = DocumentPayload(
+            document_key=document_key,
+            parent_link=data.parent_link,
+            parent_title=data.parent_title,
+            parent_summary=data.parent_summary,
+            parent_keywords=data.parent_keywords,
+            child_links=data.child_links,
+            child_contents_compressed=compress_json(data.child_contents),
+        )
+        document_point = models.PointStruct(
+            id=document_key,
+            vector={"summary": summary_embedding},
+            payload=document_payload.model_dump(),
+        )
+        return points, document_point
+
+    def upsert_qdrant_points(
+        self,
+        points: list[models.PointStruct],
+        collection_name: str,
+        stale_point_ids: Optional[list[str]] = None,
+    ):
+        self.ensure_qdrant_collection(collection_name)
+        try:
+            self.qdrant_client.upsert(collection_name=collection_name, points=points)
+            if stale_point_ids:
                 self.qdrant_client.delete(
-                    collection_name=collection_name, points_selector=point_ids
+                    collection_name=collection_name,
+                    points_selector=models.PointIdsList(points=stale_point_ids),
                 )
-            except Exception as e:
-                log.error(f"Error deleting from qdrant collection: {e}", exc_info=True)
-                raise e
             return True
         except Exception as e:
-            log.error(f"Error deleting from qdrant collection: {e}", exc_info=True)
+            log.error(f"Error adding to qdrant collection: {e}", exc_info=True)
+            # the collection may have been dropped, check it again on the next write
+            schema_registry.invalidate(collection_name)
+            schema_registry.invalidate(self.document_collection_name(collection_name))
             raise e
 
-    def add_to_meilisearch_collection(self, data, collection_name: str):
-        # let us check if the collection exists
-        indexes = self.meilisearch_client.get_indexes()
-        existing_collection_names = [index.uid for index in indexes["results"]]
-        if collection_name not in existing_collection_names:
-            # create collection with default params
-            self.meilisearch_client.create_index(
-                collection_name, {"primaryKey": "uuid"}
-            )
-            # TODO: move the settings to a config file
-            self.meilisearch_client.index(collection_name).update_settings(
-                {
-                    "rankingRules": [
-                        "words",
-                        "typo",
-                        "proximity",
-                        "attribute",
-                        "sort",
-                        "exactness",
-                    ],
-                    "distinctAttribute": "parent_link",
-                    "searchableAttributes": [
-                        "parent_link",
-                        "parent_summary",
-                        "parent_keywords",
-                        "parent_title",
-                    ],
-                    "displayedAttributes": [
-                        "parent_link",
-                        "parent_summary",
-                        "parent_title",
-                        "parent_keywords",
-                    ],
-                    "sortableAttributes": ["parent_link", "parent_title"],
-                    "typoTolerance": {
-                        "minWordSizeForTypos": {"oneTypo": 8, "twoTypos": 10},
-                        "disableOnAttributes": ["parent_summary"],
-                    },
-                    "pagination": {"maxTotalHits": 5000},
-                    "faceting": {"maxValuesPerFacet": 200},
-                    "filterableAttributes": ["parent_link"],
-                    "searchCutoffMs": 150,
-                }
+    def delete_from_qdrant_collection(self, links: list[str], collection_name: str):
+        """
+        Deletes every point of the given links with a single filter selector call,
+        without scrolling the point ids first.
+        """
+        points_selector = models.FilterSelector(
+            filter=models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key="parent_link", match=models.MatchAny(any=links)
+                    )
+                ]
             )
+        )
         try:
-            # add the data to the collection
-            self.meilisearch_client.index(collection_name).add_documents(
-                data.model_dump()
+            self.qdrant_client.delete(
+                collection_name=collection_name, points_selector=points_selector
             )
+            document_collection_name = self.document_collection_name(collection_name)
+            if schema_registry.qdrant_collection_exists(document_collection_name):
+                self.qdrant_client.delete(
+                    collection_name=document_collection_name,
+                    points_selector=points_selector,
+                )
             return True
         except Exception as e:
-            log.error(f"Error adding to meilisearch collection: {e}", exc_info=True)
+            log.error(f"Error deleting from qdrant collection: {e}", exc_info=True)
             raise e
 
+    def add_to_meilisearch_collection(self, data, collection_name: str) -> Future:
+        """
+        Buffers the document, which is sent in a compressed batch in the background.
+
+        Returns:
+            Future: Resolves once Meilisearch has applied the document's batch.
+        """
+        return self.meilisearch_writer.add(collection_name, data.model_dump())
+
     def delete_from_meilisearch_collection(self, links, collection_name: str):
-        # check if the field is filterable
-        meili_settings = self.meilisearch_client.index(collection_name).get_settings()
-        if "parent_link" not in meili_settings["filterableAttributes"]:
-            log.debug("Meilisearch index is not filterable, updating...")
-            self.meilisearch_client.index(collection_name).update_filterable_attributes(
-                ["parent_link"]
-            )
-        filter = f"parent_link IN {links}"
+        # send buffered documents first so that the delete is applied after them
+        self.meilisearch_writer.flush(collection_name)
+        # make sure the index can be filtered by parent_link, once per process
+        schema_registry.ensure_meilisearch_index(collection_name)
+        # quote every link so that commas or quotes in urls do not break the filter,
+        # non-ASCII characters are kept as is since the filter has no \u escapes
+        quoted_links = ", ".join(json.dumps(link, ensure_ascii=False) for link in links)
+        filter = f"parent_link IN [{quoted_links}]"
         self.meilisearch_client.index(collection_name).delete_documents(filter=filter)
+        return True
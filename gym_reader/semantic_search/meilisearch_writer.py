@@ -0,0 +1,201 @@
+import atexit
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+import httpx
+from meilisearch import Client as MeilisearchClient
+from gym_reader.clients.meilisearch_client import meilisearch_client
+from gym_reader.logger import get_logger
+from gym_reader.semantic_search.schema_registry import schema_registry
+from gym_reader.settings import get_settings
+
+log = get_logger(__name__)
+settings = get_settings()
+
+
+class MeilisearchWriter:
+    """
+    Buffers documents per index and sends them as gzip compressed NDJSON batches.
+
+    A batch is flushed once it reaches MEILISEARCH_BATCH_MAX_BYTES or has waited
+    MEILISEARCH_FLUSH_INTERVAL_SECONDS. Flushing and task tracking happen on a
+    background thread, so callers never block on Meilisearch. Tasks that end up
+    failed are logged and kept in failed_tasks.
+
+    add returns a future that resolves once the Meilisearch task of the document's
+    batch has succeeded, and fails if the batch could not be sent or its task
+    failed, so callers can confirm the write before recording it as done.
+    """
+
+    def __init__(self, client: MeilisearchClient):
+        self.client = client
+        self.http = httpx.Client(
+            base_url=client.config.url,
+            headers={"Authorization": f"Bearer {client.config.api_key}"},
+            timeout=60,
+        )
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[bytes]] = {}
+        self._buffer_futures: Dict[str, List[Future]] = {}
+        self._buffer_bytes: Dict[str, int] = {}
+        self._buffer_started_at: Dict[str, float] = {}
+        self._pending_tasks: Dict[int, Tuple[str, List[Future]]] = {}
+        self._last_task_poll = 0.0
+        self.failed_tasks: List[Dict[str, Any]] = []
+        self.stats = {"documents": 0, "batches": 0, "tasks_succeeded": 0}
+        self._wakeup = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        # processes that must flush on SIGTERM turn it into an exit, see the
+        # indexing service
+        atexit.register(self.flush)
+
+    def add(self, index_uid: str, document: Dict[str, Any]) -> Future:
+        line = json.dumps(document).encode("utf-8") + b"\n"
+        future = Future()
+        with self._lock:
+            self._buffers.setdefault(index_uid, []).append(line)
+            self._buffer_futures.setdefault(index_uid, []).append(future)
+            self._buffer_bytes[index_uid] = self._buffer_bytes.get(index_uid, 0) + len(
+                line
+            )
+            self._buffer_started_at.setdefault(index_uid, time.monotonic())
+            is_full = (
+                self._buffer_bytes[index_uid] >= settings.MEILISEARCH_BATCH_MAX_BYTES
+            )
+        if is_full:
+            self._wakeup.set()
+        return future
+
+    def flush(self, index_uid: str = None):
+        """
+        Sends the buffered documents of one index, or of every index, right away.
+        """
+        with self._lock:
+            index_uids = [index_uid] if index_uid else list(self._buffers)
+            batches = {
+                uid: self._take_buffer(uid)
+                for uid in index_uids
+                if uid in self._buffers
+            }
+        for uid, (lines, futures) in batches.items():
+            self._send(uid, lines, futures)
+
+    def _take_buffer(self, index_uid: str) -> Tuple[List[bytes], List[Future]]:
+        self._buffer_bytes.pop(index_uid, None)
+        self._buffer_started_at.pop(index_uid, None)
+        return self._buffers.pop(index_uid), self._buffer_futures.pop(index_uid, [])
+
+    def _send(self, index_uid: str, lines: List[bytes], futures: List[Future]):
+        try:
+            for task_uid in schema_registry.ensure_meilisearch_index(index_uid):
+                self._track_task(task_uid, index_uid, [])
+            response = self.http.post(
+                f"/indexes/{index_uid}/documents",
+                params={"primaryKey": "uuid"},
+                content=gzip.compress(b"".join(lines)),
+                headers={
+                    "Content-Type": "application/x-ndjson",
+                    "Content-Encoding": "gzip",
+                },
+            )
+            response.raise_for_status()
+            self._track_task(response.json()["taskUid"], index_uid, futures)
+            self.stats["documents"] += len(lines)
+            self.stats["batches"] += 1
+            log.debug(f"Sent {len(lines)} documents to meilisearch index {index_uid}")
+        except Exception as e:
+            log.error(
+                f"Error sending {len(lines)} documents to {index_uid}: {e}",
+                exc_info=True,
+            )
+            self.failed_tasks.append(
+                {"index_uid": index_uid, "documents": len(lines), "error": str(e)}
+            )
+            for future in futures:
+                future.set_exception(e)
+
+    def _track_task(self, task_uid: int, index_uid: str, futures: List[Future]):
+        with self._lock:
+            self._pending_tasks[task_uid] = (index_uid, futures)
+
+    def _flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                uid
+                for uid in self._buffers
+                if self._buffer_bytes[uid] >= settings.MEILISEARCH_BATCH_MAX_BYTES
+                or now - self._buffer_started_at[uid]
+                >= settings.MEILISEARCH_FLUSH_INTERVAL_SECONDS
+            ]
+            batches = {uid: self._take_buffer(uid) for uid in due}
+        for uid, (lines, futures) in batches.items():
+            self._send(uid, lines, futures)
+
+    def _poll_tasks(self):
+        if (
+            time.monotonic() - self._last_task_poll
+            < settings.MEILISEARCH_TASK_POLL_SECONDS
+        ):
+            return
+        self._last_task_poll = time.monotonic()
+        with self._lock:
+            task_uids = list(self._pending_tasks)
+        if not task_uids:
+            return
+        try:
+            tasks = self.client.get_tasks(
+                {
+                    "uids": [str(task_uid) for task_uid in task_uids],
+                    "statuses": ["succeeded", "failed", "canceled"],
+                }
+            )
+        except Exception as e:
+            log.error(f"Error polling meilisearch tasks: {e}", exc_info=True)
+            return
+        for task in tasks.results:
+            with self._lock:
+                index_uid, futures = self._pending_tasks.pop(task.uid, (None, []))
+            if task.status == "succeeded":
+                self.stats["tasks_succeeded"] += 1
+                for future in futures:
+                    future.set_result(task.uid)
+            else:
+                log.error(f"Meilisearch task {task.uid} on {index_uid}: {task.error}")
+                self.failed_tasks.append(
+                    {"index_uid": index_uid, "task_uid": task.uid, "error": task.error}
+                )
+                for future in futures:
+                    future.set_exception(
+                        RuntimeError(
+                            f"Meilisearch task {task.uid} {task.status}: {task.error}"
+                        )
+                    )
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=settings.MEILISEARCH_FLUSH_INTERVAL_SECONDS / 2)
+            self._wakeup.clear()
+            try:
+                self._flush_due()
+                self._poll_tasks()
+            except Exception as e:
+                log.error(f"Error in meilisearch writer: {e}", exc_info=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self.stats,
+                "buffered_documents": sum(
+                    len(lines) for lines in self._buffers.values()
+                ),
+                "pending_tasks": len(self._pending_tasks),
+                "failed_tasks": len(self.failed_tasks),
+            }
+
+
+meilisearch_writer = MeilisearchWriter(meilisearch_client)
@@ -0,0 +1,71 @@
+import resource
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from gym_reader.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of tokenizers and local models.
+
+    Every model is loaded on first use and then shared by all consumers
+    (GymIndex, HybridSearch, ...), so a process never holds two copies of it.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.models = {}
+                    cls._instance.stats = {}
+        return cls._instance
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the model registered under key, loading it with loader on first use.
+        """
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            if key not in self.models:
+                # ru_maxrss is the peak RSS in KB on Linux
+                rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                start = time.monotonic()
+                self.models[key] = loader()
+                load_seconds = time.monotonic() - start
+                rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                self.stats[key] = {
+                    "load_seconds": round(load_seconds, 3),
+                    "rss_increase_mb": round((rss_after - rss_before) / 1024, 1),
+                }
+                log.info(f"Loaded {key}: {self.stats[key]}")
+            return self.models[key]
+
+    def get_tokenizer(self, name: str = "cl100k_base"):
+        import tiktoken
+
+        return self.get(f"tiktoken:{name}", lambda: tiktoken.get_encoding(name))
+
+    def get_text_embedding_model(
+        self, name: str = "BAAI/bge-small-en-v1.5", threads: Optional[int] = None
+    ):
+        from fastembed import TextEmbedding
+
+        return self.get(
+            f"fastembed:{name}:{threads}",
+            lambda: TextEmbedding(model_name=name, threads=threads),
+        )
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return dict(self.stats)
+
+
+model_registry = ModelRegistry()
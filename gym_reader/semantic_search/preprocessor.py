@@ -1,12 +1,18 @@
-from typing import Optional
+import uuid
+from typing import Optional, List
 from qdrant_client import QdrantClient  # Imported models
 from gym_db.db_funcs import DbOps
 from gym_reader.clients.prisma_client import prisma_singleton
 from meilisearch import Client as MeilisearchClient
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from gym_reader.logger import get_logger
-from fastembed import TextEmbedding
-import tiktoken
+from gym_reader.semantic_search.utils import get_encoding, TokenizedDocument
+from gym_reader.semantic_search.model_registry import model_registry
+from gym_reader.settings import get_settings
+from gym_reader.executor import run_blocking
+from gym_reader.semantic_search.embedding_cache import embedding_cache
+
+settings = get_settings()
 
 
 class Preprocessor:
@@ -15,19 +21,72 @@ class Preprocessor:
         qdrant_client: QdrantClient,
         meilisearch_client: MeilisearchClient,
         openai_client: OpenAI,
+        async_openai_client: Optional[AsyncOpenAI] = None,
     ):
         self.qdrant_client = qdrant_client
         self.meilisearch_client = meilisearch_client
         self.openai_client = openai_client
-        # Embedding Model and Tokenizer
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")  # Initialize tokenizer
-        self.text_embedding_model = TextEmbedding("BAAI/bge-small-en-v1.5")
+        # used by the async embedding path, which otherwise runs in the executor
+        self.async_openai_client = async_openai_client
         self.logger = get_logger(__name__)
-        # Default embedding dimensions and providers
-        self.default_embedding_dimension_for_summary = 1536
-        self.default_embedding_provider_for_summary = "openai"
-        self.default_embedding_dimension_for_content = 1536
-        self.default_embedding_provider_for_content = "openai"
+        self.embedding_cache = embedding_cache
+        # Default embedding providers, the dimensions follow from the provider
+        self.default_embedding_provider_for_summary = (
+            settings.EMBEDDING_PROVIDER_FOR_SUMMARY
+        )
+        self.default_embedding_dimension_for_summary = self.embedding_dimension_for(
+            self.default_embedding_provider_for_summary
+        )
+        self.default_embedding_provider_for_content = (
+            settings.EMBEDDING_PROVIDER_FOR_CONTENT
+        )
+        self.default_embedding_dimension_for_content = self.embedding_dimension_for(
+            self.default_embedding_provider_for_content
+        )
+
+    # Embedding Model and Tokenizer are loaded on first use and shared process-wide
+    @property
+    def tokenizer(self):
+        return get_encoding("cl100k_base")
+
+    @property
+    def text_embedding_model(self):
+        return model_registry.get_text_embedding_model(
+            settings.LOCAL_EMBEDDING_MODEL, threads=settings.LOCAL_EMBEDDING_THREADS
+        )
+
+    @staticmethod
+    def embedding_model_for(provider: str) -> str:
+        if provider == "openai":
+            return settings.OPENAI_EMBEDDING_MODEL
+        return settings.LOCAL_EMBEDDING_MODEL
+
+    @staticmethod
+    def embedding_dimension_for(provider: str) -> int:
+        if provider == "openai":
+            return settings.OPENAI_EMBEDDING_DIMENSION
+        # the local model has a fixed output dimension
+        return settings.LOCAL_EMBEDDING_DIMENSION
+
+    @staticmethod
+    def max_chunk_tokens_for(provider: str) -> int:
+        if provider == "openai":
+            return settings.MAX_TOKENS_PER_CHUNK
+        # anything past the local model's input size would not be embedded
+        return min(
+            settings.MAX_TOKENS_PER_CHUNK, settings.LOCAL_EMBEDDING_MAX_CHUNK_TOKENS
+        )
+
+    @staticmethod
+    def document_collection_name(collection_name: str) -> str:
+        """
+        Document level fields are stored once per document in this companion collection.
+        """
+        return f"{collection_name}_documents"
+
+    @staticmethod
+    def document_key(collection_name: str, parent_link: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{collection_name}:{parent_link}"))
 
     async def get_client(self):
         return await prisma_singleton.get_client()
@@ -35,29 +94,223 @@ class Preprocessor:
     def get_embedding(
         self,
         text: str,
-        model: str = "text-embedding-3-small",
-        dimension: Optional[int] = 1536,
+        model: Optional[str] = None,
+        dimension: Optional[int] = None,
         provider: str = "openai",
+    ):
+        model = model or self.embedding_model_for(provider)
+        dimension = dimension or self.embedding_dimension_for(provider)
+        cache_key = self.embedding_cache.make_key(text, model, dimension, provider)
+        cached = self.embedding_cache.get_many([cache_key])
+        if cache_key in cached:
+            return cached[cache_key]
+        embedding = self._get_embedding_uncached(text, model, dimension, provider)
+        self.embedding_cache.set_many([(cache_key, embedding)])
+        return embedding
+
+    async def aget_embedding(
+        self,
+        text: str,
+        model: Optional[str] = None,
+        dimension: Optional[int] = None,
+        provider: str = "openai",
+    ):
+        """
+        Async variant of get_embedding. The cache lookups, which are blocking, run in
+        the bounded executor.
+        """
+        model = model or self.embedding_model_for(provider)
+        dimension = dimension or self.embedding_dimension_for(provider)
+        cache_key = self.embedding_cache.make_key(text, model, dimension, provider)
+        cached = await run_blocking(self.embedding_cache.get_many, [cache_key])
+        if cache_key in cached:
+            return cached[cache_key]
+        embedding = await self._aget_embedding_uncached(
+            text, model, dimension, provider
+        )
+        await run_blocking(self.embedding_cache.set_many, [(cache_key, embedding)])
+        return embedding
+
+    def _embedding_request(self, text: str, model: str, dimension: Optional[int]):
+        """
+        Builds the OpenAI embeddings request, truncating the input to the model limit.
+        """
+        tokens = self.tokenizer.encode(text)
+        if len(tokens) > settings.MAX_TOKENS_PER_EMBEDDING_INPUT:
+            tokens = tokens[: settings.MAX_TOKENS_PER_EMBEDDING_INPUT]
+            text = self.tokenizer.decode(tokens)
+        return {
+            "model": model,
+            "input": text,
+            "encoding_format": "float",
+            "dimensions": dimension,
+        }
+
+    def _get_embedding_uncached(
+        self,
+        text: str,
+        model: str,
+        dimension: Optional[int],
+        provider: str,
     ):
         if provider == "openai":
             try:
-                MAX_TOKENS = 7000
-                tokens = self.tokenizer.encode(text)
-                if len(tokens) > MAX_TOKENS:
-                    tokens = tokens[:MAX_TOKENS]
-                    text = self.tokenizer.decode(tokens)
                 response = self.openai_client.embeddings.create(
-                    model=model,
-                    input=text,
-                    encoding_format="float",
-                    dimensions=dimension,
+                    **self._embedding_request(text, model, dimension)
                 )
                 return response.data[0].embedding
             except Exception as e:
                 self.logger.error(f"Error getting embedding: {e}", exc_info=True)
                 raise e
         else:
-            return list(self.text_embedding_model.embed(text))
+            return self._embed_locally([text])[0]
+
+    async def _aget_embedding_uncached(
+        self,
+        text: str,
+        model: str,
+        dimension: Optional[int],
+        provider: str,
+    ):
+        if provider != "openai" or self.async_openai_client is None:
+            return await run_blocking(
+                self._get_embedding_uncached, text, model, dimension, provider
+            )
+        try:
+            response = await self.async_openai_client.embeddings.create(
+                **self._embedding_request(text, model, dimension)
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            self.logger.error(f"Error getting embedding: {e}", exc_info=True)
+            raise e
+
+    def get_embeddings(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        dimension: Optional[int] = None,
+        provider: str = "openai",
+        token_counts: Optional[List[int]] = None,
+    ) -> List[List[float]]:
+        """
+        Embeds a list of texts, issuing one request per batch instead of one per text.
+
+        Batches are bounded both by input count and by total tokens so that no
+        single request goes over the provider limits.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            model (str): The embedding model to use.
+            dimension (Optional[int]): The output dimension of the embeddings.
+            provider (str): The embedding provider.
+            token_counts (Optional[List[int]]): The token count of each text when the
+                caller already knows it, so that the texts are not tokenized again.
+
+        Returns:
+            List[List[float]]: The embeddings, in the same order as the input texts.
+        """
+        if not texts:
+            return []
+        model = model or self.embedding_model_for(provider)
+        dimension = dimension or self.embedding_dimension_for(provider)
+        cache_keys = [
+            self.embedding_cache.make_key(text, model, dimension, provider)
+            for text in texts
+        ]
+        cached = self.embedding_cache.get_many(cache_keys)
+        if token_counts is None:
+            token_counts = [None] * len(texts)
+        missing = [
+            (key, text, token_count)
+            for key, text, token_count in zip(cache_keys, texts, token_counts)
+            if key not in cached
+        ]
+        if missing:
+            embeddings = self._get_embeddings_uncached(
+                [text for _, text, _ in missing],
+                model,
+                dimension,
+                provider,
+                [token_count for _, _, token_count in missing],
+            )
+            new_items = [(key, emb) for (key, _, _), emb in zip(missing, embeddings)]
+            self.embedding_cache.set_many(new_items)
+            cached.update(new_items)
+        self.logger.debug(f"Embedding cache stats: {self.embedding_cache.get_stats()}")
+        return [cached[key] for key in cache_keys]
+
+    def _get_embeddings_uncached(
+        self,
+        texts: List[str],
+        model: str,
+        dimension: Optional[int],
+        provider: str,
+        token_counts: List[Optional[int]],
+    ) -> List[List[float]]:
+        if provider != "openai":
+            return self._embed_locally(texts)
+        embeddings = []
+        for batch in self._batch_texts_by_tokens(texts, token_counts):
+            try:
+                response = self.openai_client.embeddings.create(
+                    model=model,
+                    input=batch,
+                    encoding_format="float",
+                    dimensions=dimension,
+                )
+            except Exception as e:
+                self.logger.error(f"Error getting embeddings: {e}", exc_info=True)
+                raise e
+            # the response is not guaranteed to be ordered, so sort by index
+            embeddings.extend(
+                item.embedding
+                for item in sorted(response.data, key=lambda item: item.index)
+            )
+        return embeddings
+
+    def _embed_locally(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds the texts with the local fastembed model in batched ONNX inference.
+        """
+        try:
+            return [
+                embedding.tolist()
+                for embedding in self.text_embedding_model.embed(
+                    texts, batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE
+                )
+            ]
+        except Exception as e:
+            self.logger.error(f"Error getting local embeddings: {e}", exc_info=True)
+            raise e
+
+    def _batch_texts_by_tokens(
+        self, texts: List[str], token_counts: List[Optional[int]]
+    ) -> List[List[str]]:
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text, token_count in zip(texts, token_counts):
+            max_tokens = settings.MAX_TOKENS_PER_EMBEDDING_INPUT
+            # Only tokenize when the caller did not already know the count
+            if token_count is None or token_count > max_tokens:
+                document = TokenizedDocument(text, self.tokenizer)
+                token_count = document.token_count
+                if token_count > max_tokens:
+                    token_count = max_tokens
+                    text = document.truncate(token_count)
+            if batch and (
+                batch_tokens + token_count > settings.MAX_TOKENS_PER_EMBEDDING_REQUEST
+                or len(batch) >= settings.MAX_INPUTS_PER_EMBEDDING_REQUEST
+            ):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += token_count
+        if batch:
+            batches.append(batch)
+        return batches
 
     async def check_if_link_exists(self, link: str, repo: str):
         try:
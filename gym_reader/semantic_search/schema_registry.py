@@ -0,0 +1,170 @@
+import threading
+from typing import Dict, List
+from meilisearch.errors import MeilisearchApiError
+from qdrant_client import models
+from gym_reader.clients.meilisearch_client import meilisearch_client
+from gym_reader.clients.qdrant_client import qdrant_client
+from gym_reader.logger import get_logger
+from gym_reader.semantic_search.storage_profiles import (
+    get_storage_profile,
+    vectors_config,
+)
+
+log = get_logger(__name__)
+
+MEILISEARCH_INDEX_SETTINGS = {
+    "rankingRules": [
+        "words",
+        "typo",
+        "proximity",
+        "attribute",
+        "sort",
+        "exactness",
+    ],
+    "distinctAttribute": "parent_link",
+    "searchableAttributes": [
+        "parent_link",
+        "parent_summary",
+        "parent_keywords",
+        "parent_title",
+    ],
+    "displayedAttributes": [
+        "parent_link",
+        "parent_summary",
+        "parent_title",
+        "parent_keywords",
+    ],
+    "sortableAttributes": ["parent_link", "parent_title"],
+    "typoTolerance": {
+        "minWordSizeForTypos": {"oneTypo": 8, "twoTypos": 10},
+        "disableOnAttributes": ["parent_summary"],
+    },
+    "pagination": {"maxTotalHits": 5000},
+    "faceting": {"maxValuesPerFacet": 200},
+    "filterableAttributes": ["parent_link"],
+    "searchCutoffMs": 150,
+}
+
+
+class SchemaRegistry:
+    """
+    Ensures that every Qdrant collection and Meilisearch index exists with the
+    right vectors, payload indexes and settings, once per process.
+
+    Only positive results are cached, since another process may create a collection
+    at any time. Call invalidate when a collection or index is dropped or changed.
+    """
+
+    def __init__(self):
+        self.qdrant_client = qdrant_client
+        self.meilisearch_client = meilisearch_client
+        self._lock = threading.Lock()
+        self._qdrant_collections = set()
+        self._meilisearch_indexes = set()
+
+    def qdrant_collection_exists(self, collection_name: str) -> bool:
+        if collection_name in self._qdrant_collections:
+            return True
+        if self.qdrant_client.collection_exists(collection_name):
+            self._qdrant_collections.add(collection_name)
+            return True
+        return False
+
+    def ensure_qdrant_collection(
+        self,
+        collection_name: str,
+        vector_sizes: Dict[str, int],
+        payload_indexes: List[str],
+        profile_name: str,
+    ):
+        """
+        Creates the collection with the storage profile of profile_name and the
+        keyword payload indexes, unless it is already known to exist. Collections
+        that already exist get the payload indexes they are missing, since fields
+        such as document_key were added after they were created.
+        """
+        if collection_name in self._qdrant_collections:
+            return
+        with self._lock:
+            if collection_name in self._qdrant_collections:
+                return
+            if self.qdrant_client.collection_exists(collection_name):
+                existing_indexes = set(
+                    self.qdrant_client.get_collection(collection_name).payload_schema
+                )
+                missing_indexes = [
+                    field_name
+                    for field_name in payload_indexes
+                    if field_name not in existing_indexes
+                ]
+            else:
+                profile = get_storage_profile(profile_name)
+                log.info(
+                    f"Creating {collection_name} with storage profile {profile.name}"
+                )
+                self.qdrant_client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=vectors_config(profile, vector_sizes),
+                )
+                missing_indexes = payload_indexes
+            try:
+                for field_name in missing_indexes:
+                    self.qdrant_client.create_payload_index(
+                        collection_name=collection_name,
+                        field_name=field_name,
+                        field_schema=models.PayloadSchemaType.KEYWORD,
+                    )
+            except Exception as e:
+                log.error(f"Error creating payload index: {e}", exc_info=True)
+                raise e
+            self._qdrant_collections.add(collection_name)
+
+    def ensure_meilisearch_index(self, index_uid: str) -> List[int]:
+        """
+        Creates the index with its settings, or makes sure an existing index can be
+        filtered by parent_link.
+
+        Returns:
+            List[int]: The uids of the tasks that were enqueued, if any.
+        """
+        if index_uid in self._meilisearch_indexes:
+            return []
+        task_uids = []
+        with self._lock:
+            if index_uid in self._meilisearch_indexes:
+                return []
+            index = self.meilisearch_client.index(index_uid)
+            try:
+                filterable_attributes = index.get_filterable_attributes()
+                if "parent_link" not in filterable_attributes:
+                    log.debug("Meilisearch index is not filterable, updating...")
+                    task = index.update_filterable_attributes(
+                        filterable_attributes + ["parent_link"]
+                    )
+                    task_uids.append(task.task_uid)
+            except MeilisearchApiError as e:
+                if e.code != "index_not_found":
+                    raise e
+                task = self.meilisearch_client.create_index(
+                    index_uid, {"primaryKey": "uuid"}
+                )
+                task_uids.append(task.task_uid)
+                task = index.update_settings(MEILISEARCH_INDEX_SETTINGS)
+                task_uids.append(task.task_uid)
+            self._meilisearch_indexes.add(index_uid)
+        return task_uids
+
+    def invalidate(self, name: str = None):
+        """
+        Forgets the cached state of one collection or index, or of all of them.
+        """
+        with self._lock:
+            if name is None:
+                self._qdrant_collections.clear()
+                self._meilisearch_indexes.clear()
+            else:
+                self._qdrant_collections.discard(name)
+                self._meilisearch_indexes.discard(name)
+
+
+schema_registry = SchemaRegistry()
@@ -0,0 +1,398 @@
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+from cachetools import TTLCache
+from qdrant_client import QdrantClient, models
+from gym_reader.clients.redis_client import redis_client
+from gym_reader.data_models import QuantizationType, StorageProfile
+from gym_reader.logger import get_logger
+from gym_reader.settings import get_settings
+
+log = get_logger(__name__)
+settings = get_settings()
+
+STORAGE_PROFILES: Dict[str, StorageProfile] = {
+    # full precision vectors and graph in RAM, what collections used to get
+    "default": StorageProfile(name="default"),
+    # int8 vectors in RAM, originals on disk for rescoring
+    "balanced": StorageProfile(
+        name="balanced",
+        quantization=QuantizationType.SCALAR,
+        on_disk_vectors=True,
+        oversampling=1.5,
+    ),
+    # 1 bit per dimension in RAM, originals on disk, sparser graph
+    "compact": StorageProfile(
+        name="compact",
+        quantization=QuantizationType.BINARY,
+        on_disk_vectors=True,
+        oversampling=3.0,
+        hnsw_m=8,
+        hnsw_ef_construct=64,
+    ),
+    # denser graph for collections where recall matters more than memory
+    "high_recall": StorageProfile(
+        name="high_recall",
+        quantization=QuantizationType.SCALAR,
+        hnsw_m=32,
+        hnsw_ef_construct=256,
+        hnsw_ef=128,
+    ),
+}
+
+
+# repo -> profile name, written by the migrate command. It takes precedence over
+# QDRANT_STORAGE_PROFILES, so that new collections and searches follow a migration.
+SELECTED_PROFILES_KEY = "qdrant:storage_profiles"
+
+_selected_profiles = TTLCache(
+    maxsize=1, ttl=settings.QDRANT_STORAGE_PROFILE_REFRESH_SECONDS
+)
+_selected_profiles_lock = threading.Lock()
+
+
+def get_selected_profiles() -> Dict[str, str]:
+    """
+    Returns the profiles saved by the migrate command, refreshed from Redis at most
+    every QDRANT_STORAGE_PROFILE_REFRESH_SECONDS since searches call this.
+    """
+    with _selected_profiles_lock:
+        selected = _selected_profiles.get(SELECTED_PROFILES_KEY)
+        if selected is None:
+            try:
+                selected = {
+                    key.decode(): value.decode()
+                    for key, value in redis_client.hgetall(
+                        SELECTED_PROFILES_KEY
+                    ).items()
+                }
+            except Exception as e:
+                # fall back to the configured profiles rather than fail the search
+                log.warning(f"Could not read the selected storage profiles: {e}")
+                selected = {}
+            _selected_profiles[SELECTED_PROFILES_KEY] = selected
+        return selected
+
+
+def save_selected_profile(collection_name: str, profile_name: str):
+    redis_client.hset(SELECTED_PROFILES_KEY, collection_name, profile_name)
+    with _selected_profiles_lock:
+        _selected_profiles.clear()
+
+
+def get_storage_profile(collection_name: str) -> StorageProfile:
+    """
+    Returns the storage profile selected for a repo, or the default one.
+    """
+    profile_name = get_selected_profiles().get(
+        collection_name,
+        settings.QDRANT_STORAGE_PROFILES.get(
+            collection_name, settings.QDRANT_DEFAULT_STORAGE_PROFILE
+        ),
+    )
+    if profile_name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {profile_name}")
+    return STORAGE_PROFILES[profile_name]
+
+
+def hnsw_config(profile: StorageProfile) -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct
+    )
+
+
+def quantization_config(profile: StorageProfile):
+    if profile.quantization == QuantizationType.SCALAR:
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=profile.quantized_always_ram,
+            )
+        )
+    if profile.quantization == QuantizationType.BINARY:
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(
+                always_ram=profile.quantized_always_ram
+            )
+        )
+    return None
+
+
+def vectors_config(
+    profile: StorageProfile, vector_sizes: Dict[str, int]
+) -> Dict[str, models.VectorParams]:
+    return {
+        name: models.VectorParams(
+            size=size,
+            distance=models.Distance.COSINE,
+            on_disk=profile.on_disk_vectors,
+            hnsw_config=hnsw_config(profile),
+            quantization_config=quantization_config(profile),
+        )
+        for name, size in vector_sizes.items()
+    }
+
+
+def search_params(profile: StorageProfile) -> models.SearchParams:
+    quantization = None
+    if profile.quantization is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=profile.rescore, oversampling=profile.oversampling
+        )
+    return models.SearchParams(hnsw_ef=profile.hnsw_ef, quantization=quantization)
+
+
+def apply_storage_profile(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    profile: StorageProfile,
+    vector_names: list[str],
+):
+    """
+    Applies a storage profile to an existing collection. Qdrant rebuilds the
+    affected indexes in the background, the collection stays searchable meanwhile.
+    """
+    quantization = quantization_config(profile) or models.Disabled.DISABLED
+    qdrant_client.update_collection(
+        collection_name=collection_name,
+        vectors_config={
+            name: models.VectorParamsDiff(
+                on_disk=profile.on_disk_vectors,
+                hnsw_config=hnsw_config(profile),
+                quantization_config=quantization,
+            )
+            for name in vector_names
+        },
+    )
+    log.info(f"Applied storage profile {profile.name} to {collection_name}")
+
+
+def migrate_collections(
+    qdrant_client: QdrantClient,
+    collection_names: List[str],
+    profile: StorageProfile,
+) -> List[str]:
+    """
+    Applies a profile to every named vector of the collections that exist. Repos
+    indexed before the two tier layout have no document collection and keep the
+    summary vector on their chunks, so the vectors are read from each collection.
+
+    Returns:
+        List[str]: The collections the profile was applied to.
+    """
+    existing = [
+        name for name in collection_names if qdrant_client.collection_exists(name)
+    ]
+    if not existing:
+        raise ValueError(f"None of {collection_names} exist")
+    for name in existing:
+        vectors = qdrant_client.get_collection(name).config.params.vectors
+        # a single unnamed vector is updated under the empty name
+        vector_names = list(vectors) if isinstance(vectors, dict) else [""]
+        apply_storage_profile(qdrant_client, name, profile, vector_names)
+    return existing
+
+
+def estimate_memory_mb(
+    profile: StorageProfile, vector_sizes: Dict[str, int], num_points: int = 100_000
+) -> float:
+    """
+    Estimates the RAM used by the vectors and HNSW graphs of num_points points.
+    Payloads are not included.
+
+    Chunk points only hold the content vector, the summary vector is stored once
+    per document in the document tier.
+    """
+    total_bytes = 0.0
+    for size in vector_sizes.values():
+        if not profile.on_disk_vectors:
+            total_bytes += num_points * size * 4  # float32 originals
+        if profile.quantized_always_ram:
+            if profile.quantization == QuantizationType.SCALAR:
+                total_bytes += num_points * size  # one byte per dimension
+            elif profile.quantization == QuantizationType.BINARY:
+                total_bytes += num_points * size / 8  # one bit per dimension
+        # layer 0 keeps up to 2 * m links of 4 bytes per point
+        total_bytes += num_points * profile.hnsw_m * 2 * 4
+    return round(total_bytes / (1024 * 1024), 1)
+
+
+def measure_search_latency_p95(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    profile: StorageProfile,
+    vector_name: str,
+    vector_size: int,
+    samples: int = 100,
+    limit: int = 3,
+) -> float:
+    """
+    Measures the p95 latency in milliseconds of a vector query against a collection,
+    using random query vectors so that no embedding calls are made.
+    """
+    latencies = []
+    params = search_params(profile)
+    for _ in range(samples):
+        query = [random.uniform(-1, 1) for _ in range(vector_size)]
+        start = time.perf_counter()
+        qdrant_client.query_points(
+            collection_name,
+            query=query,
+            using=vector_name,
+            limit=limit,
+            search_params=params,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return round(latencies[int(0.95 * (len(latencies) - 1))], 2)
+
+
+def sample_points(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    vector_name: str,
+    num_points: int,
+) -> List[models.PointStruct]:
+    """
+    Reads up to num_points points of a collection with one of their vectors.
+    """
+    points = []
+    offset = None
+    while len(points) < num_points:
+        records, offset = qdrant_client.scroll(
+            collection_name,
+            limit=min(256, num_points - len(points)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=[vector_name],
+        )
+        points.extend(
+            models.PointStruct(
+                id=record.id, vector={vector_name: record.vector[vector_name]}
+            )
+            for record in records
+        )
+        if offset is None:
+            break
+    return points
+
+
+def wait_for_indexing(
+    qdrant_client: QdrantClient, collection_name: str, timeout: float = 600.0
+):
+    deadline = time.monotonic() + timeout
+    while (
+        qdrant_client.get_collection(collection_name).status
+        != models.CollectionStatus.GREEN
+    ):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{collection_name} was not indexed in {timeout}s")
+        time.sleep(1)
+
+
+def benchmark_storage_profiles(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    vector_name: str,
+    vector_size: int,
+    samples: int = 100,
+    num_points: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    Measures the p95 search latency of every profile. A sample of the collection's
+    points is copied into a scratch collection per profile, which is dropped after
+    it is measured, so the collection itself is left untouched.
+
+    Returns:
+        Dict[str, float]: The p95 latency in milliseconds per profile name.
+    """
+    points = sample_points(
+        qdrant_client,
+        collection_name,
+        vector_name,
+        num_points or settings.QDRANT_BENCHMARK_SAMPLE_POINTS,
+    )
+    if not points:
+        raise ValueError(f"{collection_name} has no points to benchmark")
+    results = {}
+    for profile in STORAGE_PROFILES.values():
+        scratch_name = f"{collection_name}_benchmark_{profile.name}"
+        if qdrant_client.collection_exists(scratch_name):
+            qdrant_client.delete_collection(scratch_name)
+        qdrant_client.create_collection(
+            collection_name=scratch_name,
+            vectors_config=vectors_config(profile, {vector_name: vector_size}),
+        )
+        try:
+            for start in range(0, len(points), 256):
+                qdrant_client.upsert(scratch_name, points=points[start : start + 256])
+            wait_for_indexing(qdrant_client, scratch_name)
+            results[profile.name] = measure_search_latency_p95(
+                qdrant_client,
+                scratch_name,
+                profile,
+                vector_name,
+                vector_size,
+                samples,
+            )
+        finally:
+            qdrant_client.delete_collection(scratch_name)
+    return results
+
+
+def main():
+    from gym_reader.clients.qdrant_client import qdrant_client
+    from gym_reader.semantic_search.preprocessor import Preprocessor
+
+    parser = argparse.ArgumentParser(description="Manage Qdrant storage profiles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="apply a profile to a collection")
+    migrate.add_argument("collection_name")
+    migrate.add_argument("profile", choices=list(STORAGE_PROFILES))
+    report = subparsers.add_parser("report", help="report memory and p95 latency")
+    report.add_argument("--collection_name", default=None)
+    report.add_argument("--samples", type=int, default=100)
+    report.add_argument("--num_points", type=int, default=None)
+    args = parser.parse_args()
+
+    content_size = Preprocessor.embedding_dimension_for(
+        settings.EMBEDDING_PROVIDER_FOR_CONTENT
+    )
+    if args.command == "migrate":
+        profile = STORAGE_PROFILES[args.profile]
+        migrate_collections(
+            qdrant_client,
+            [
+                args.collection_name,
+                Preprocessor.document_collection_name(args.collection_name),
+            ],
+            profile,
+        )
+        # saved, so that searches use the profile's parameters from now on
+        save_selected_profile(args.collection_name, profile.name)
+        return
+    latencies = {}
+    if args.collection_name:
+        latencies = benchmark_storage_profiles(
+            qdrant_client,
+            args.collection_name,
+            "content",
+            content_size,
+            args.samples,
+            args.num_points,
+        )
+        current = get_storage_profile(args.collection_name)
+        print(f"{args.collection_name} uses the {current.name} profile")
+    for profile in STORAGE_PROFILES.values():
+        memory_mb = estimate_memory_mb(profile, {"content": content_size})
+        line = f"{profile.name}: {memory_mb} MB per 100k chunks"
+        if profile.name in latencies:
+            line += f", p95 search latency {latencies[profile.name]} ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,94 @@
+import base64
+import json
+import zlib
 import tiktoken
-from typing import Optional
+from typing import Iterator, List, NamedTuple, Optional
+from gym_reader.semantic_search.model_registry import model_registry
+
+
+def get_encoding(name: str = "cl100k_base") -> tiktoken.Encoding:
+    """
+    Returns the tiktoken encoding, loading it only once per process.
+    """
+    return model_registry.get_tokenizer(name)
+
+
+class TokenChunk(NamedTuple):
+    text: str
+    start: int  # offset of the first token of the chunk in the document
+    end: int  # offset one past the last token of the chunk in the document
+    token_count: int
+
+
+class TokenizedDocument:
+    """
+    A document encoded exactly once, from which chunks are sliced as token ranges.
+
+    The token counts travel with the chunks, so downstream consumers such as the
+    embedder do not need to tokenize the text again.
+    """
+
+    def __init__(self, text: str, encoding: Optional[tiktoken.Encoding] = None):
+        self.encoding = encoding or get_encoding()
+        self.tokens = self.encoding.encode(text)
+
+    @classmethod
+    def from_tokens(
+        cls, tokens: List[int], encoding: Optional[tiktoken.Encoding] = None
+    ) -> "TokenizedDocument":
+        """
+        Wraps tokens encoded earlier, e.g. by the extractor, without encoding again.
+        """
+        document = cls.__new__(cls)
+        document.encoding = encoding or get_encoding()
+        document.tokens = tokens
+        return document
+
+    @property
+    def token_count(self) -> int:
+        return len(self.tokens)
+
+    def iter_chunks(
+        self, max_tokens: Optional[int] = None, overlap: Optional[int] = None
+    ) -> Iterator[TokenChunk]:
+        """
+        Lazily yields overlapping chunks of the document.
+
+        Args:
+            max_tokens (int): The maximum number of tokens per chunk.
+            overlap (int): The number of overlapping tokens between chunks.
+
+        Yields:
+            TokenChunk: The chunk text with its token offsets and token count.
+        """
+        if max_tokens is None:
+            max_tokens = 1000
+        if overlap is None:
+            overlap = 100
+        start = 0
+        while start < len(self.tokens):
+            end = min(start + max_tokens, len(self.tokens))
+            yield TokenChunk(
+                text=self.encoding.decode(self.tokens[start:end]),
+                start=start,
+                end=end,
+                token_count=end - start,
+            )
+            if end >= len(self.tokens):
+                break
+            # Move back by 'overlap' tokens for the next chunk
+            start = end - overlap
+
+    def truncate(self, max_tokens: int) -> str:
+        """
+        Returns the text of the first max_tokens tokens of the document.
+        """
+        return self.encoding.decode(self.tokens[:max_tokens])
 
 
 def chunk_text_with_overlap(
     text: str, max_tokens: Optional[int] = None, overlap: Optional[int] = None
-) -> list[str]:
+) -> List[str]:
     """
     Splits the input text into overlapping chunks based on token count.
 
@@ -16,24 +100,20 @@ def chunk_text_with_overlap(
     Returns:
         list[str]: A list of text chunks.
     """
-    if max_tokens is None:
-        max_tokens = 1000
-    if overlap is None:
-        overlap = 100
-    encoding = tiktoken.get_encoding("cl100k_base")  # Specify the encoding model
-    tokens = encoding.encode(text)
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk_tokens = tokens[start:end]
-        chunk_text = encoding.decode(chunk_tokens)
-        chunks.append(chunk_text)
-        if end >= len(tokens):
-            break
-        # Move back by 'overlap' tokens for the next chunk
-        start = end - overlap
-    return chunks
+    document = TokenizedDocument(text)
+    return [chunk.text for chunk in document.iter_chunks(max_tokens, overlap)]
+
+
+def compress_json(value) -> str:
+    """
+    Serializes a value to json, compresses it with zlib and encodes it as base64 so
+    that it can be stored in a json payload.
+    """
+    return base64.b64encode(zlib.compress(json.dumps(value).encode("utf-8"))).decode()
+
+
+def decompress_json(value: str):
+    return json.loads(zlib.decompress(base64.b64decode(value)).decode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -1,4 +1,10 @@
 import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from collections import defaultdict
 from gym_reader.logger import get_logger
 from gym_db.gym_db.db_funcs import DbOps
 from gym_reader.clients.qdrant_client import qdrant_client
@@ -6,8 +12,11 @@ from gym_reader.clients.meilisearch_client import meilisearch_client
 from gym_reader.clients.openai_client import openai_client
 from gym_reader.clients.prisma_client import prisma_singleton
 from gym_reader.agents.extractor_agent import ContentExtractorAgent, PayloadForIndexing
+from gym_reader.clients.spider_web_crawler import spider_client
 from gym_reader.settings import get_settings
 from gym_reader.semantic_search.index import GymIndex
+from gym_reader.services.indexing_wakeup import WakeupListener
+from gym_reader.repo_config import repo_config
 from tqdm import tqdm
 
 log = get_logger(__name__)
@@ -18,68 +27,341 @@ extractor_agent = ContentExtractorAgent()
 gym_index = GymIndex(qdrant_client, meilisearch_client, openai_client)
 
 
+class StageStats:
+    """
+    Keeps per-stage counters of the indexing pipeline, from when it gets busy until
+    it drains.
+    """
+
+    def __init__(self, stages: list[str]):
+        self.started_at = time.monotonic()
+        self.unchanged = 0
+        self.stats = {
+            stage: {"processed": 0, "failed": 0, "busy_seconds": 0.0}
+            for stage in stages
+        }
+
+    def record(self, stage: str, seconds: float, failed: bool = False):
+        self.stats[stage]["busy_seconds"] += seconds
+        self.stats[stage]["failed" if failed else "processed"] += 1
+
+    def documents(self) -> int:
+        # every document goes through the crawl stage
+        return self.stats["crawl"]["processed"] + self.stats["crawl"]["failed"]
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        parts = []
+        for stage, stat in self.stats.items():
+            throughput = stat["processed"] / elapsed if elapsed else 0.0
+            parts.append(
+                f"{stage}: {stat['processed']} ok, {stat['failed']} failed, "
+                f"{stat['busy_seconds']:.1f}s busy, {throughput:.2f} docs/s"
+            )
+        header = f"Took {elapsed:.1f}s, {self.unchanged} unchanged"
+        return " | ".join([header] + parts)
+
+
+class IndexingPipeline:
+    """
+    Runs documents through crawl -> extraction -> embedding -> index write.
+
+    Every stage has its own concurrency limit, so different documents can be in
+    different stages at the same time. Blocking calls run in worker threads.
+
+    Up to INDEXING_CLAIM_BATCH_SIZE documents are in flight, and a slot is refilled
+    as soon as its document finishes, so one slow document does not hold back the
+    others.
+    """
+
+    STAGES = ["crawl", "extraction", "embedding", "write"]
+
+    def __init__(self, dbops: DbOps, worker_id: str):
+        self.dbops = dbops
+        self.worker_id = worker_id
+        self.semaphores = {
+            "crawl": asyncio.Semaphore(settings.INDEXING_CRAWL_CONCURRENCY),
+            "extraction": asyncio.Semaphore(settings.INDEXING_EXTRACTION_CONCURRENCY),
+            "embedding": asyncio.Semaphore(settings.INDEXING_EMBEDDING_CONCURRENCY),
+            "write": asyncio.Semaphore(settings.INDEXING_WRITE_CONCURRENCY),
+        }
+        self.in_flight: set[asyncio.Task] = set()
+        self.stats = StageStats(self.STAGES)
+
+    async def _run_stage(self, stage: str, stats: StageStats, func, *args):
+        async with self.semaphores[stage]:
+            start = time.monotonic()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(*args)
+                else:
+                    result = await asyncio.to_thread(func, *args)
+            except Exception:
+                stats.record(stage, time.monotonic() - start, failed=True)
+                raise
+            stats.record(stage, time.monotonic() - start)
+            return result
+
+    def _write(
+        self,
+        meta_to_add_to_index: PayloadForIndexing,
+        points,
+        stale_point_ids,
+        document_point,
+        repo: str,
+    ):
+        gym_index.upsert_qdrant_points(
+            points, collection_name=repo, stale_point_ids=stale_point_ids
+        )
+        gym_index.upsert_document_point(document_point, collection_name=repo)
+        return gym_index.add_to_meilisearch_collection(
+            meta_to_add_to_index, collection_name=repo
+        )
+
+    async def keep_lease(self, document):
+        """
+        Renews the lease of a document while it is in flight, so a slow batch is not
+        claimed again by another worker once INDEXING_LEASE_SECONDS have passed.
+        """
+        while True:
+            await asyncio.sleep(settings.INDEXING_LEASE_SECONDS / 3)
+            try:
+                renewed = await self.dbops.renew_document_lease(
+                    document.uuid, self.worker_id, settings.INDEXING_LEASE_SECONDS
+                )
+                if not renewed:
+                    log.warning(f"Lost the lease of {document.url}")
+                    return
+            except Exception as e:
+                log.error(f"Error renewing lease of {document.url}: {e}", exc_info=True)
+
+    async def index_document(self, document, stats: StageStats):
+        log.info(f"Indexing document: {document.url}")
+        lease_heartbeat = asyncio.create_task(self.keep_lease(document))
+        try:
+            # a refresh means the source changed, and a retry may be caused by a bad
+            # response, so neither must be served from cache
+            use_cache = not document.is_updated and not document.attempt_count
+            search_result = await self._run_stage(
+                "crawl",
+                stats,
+                extractor_agent.acrawl,
+                document.url,
+                use_cache,
+                repo_config.crawler_for(document.repo),
+                repo_config.crawl_limit,
+            )
+            if not search_result or not search_result[0].get("content"):
+                raise ValueError(f"Crawling {document.url} returned no content")
+            content_hash = spider_client.content_hash(search_result)
+            if document.is_indexed and document.content_hash == content_hash:
+                # the index already holds this exact content, skip extraction and
+                # embedding entirely
+                log.info(f"Content of {document.url} is unchanged, skipping")
+                stats.unchanged += 1
+                await self.dbops.mark_document_indexed(
+                    document.uuid, content_hash, document.refresh_version
+                )
+                return
+            meta_to_add_to_index: PayloadForIndexing = await self._run_stage(
+                "extraction", stats, extractor_agent.extract, search_result
+            )
+            points, stale_point_ids, document_point = await self._run_stage(
+                "embedding",
+                stats,
+                gym_index.prepare_qdrant_points,
+                meta_to_add_to_index,
+                document.repo,
+            )
+            meilisearch_write = await self._run_stage(
+                "write",
+                stats,
+                self._write,
+                meta_to_add_to_index,
+                points,
+                stale_point_ids,
+                document_point,
+                document.repo,
+            )
+            # the meilisearch write is batched, so wait until its task succeeded
+            # before recording the document as indexed; failures go to the retry path
+            await asyncio.wait_for(
+                asyncio.wrap_future(meilisearch_write),
+                timeout=settings.MEILISEARCH_WRITE_TIMEOUT_SECONDS,
+            )
+            # Update the document status to indexed
+            await self.dbops.mark_document_indexed(
+                document.uuid, content_hash, document.refresh_version
+            )
+        except Exception as e:
+            log.error(
+                f"Error indexing document {document.url}: {e}",
+                exc_info=True,
+            )
+            await self.record_failure(document, e)
+        finally:
+            lease_heartbeat.cancel()
+            # an unreleased lease would block retries until it expires
+            await self.dbops.release_document_lease(document.uuid, self.worker_id)
+
+    async def record_failure(self, document, error: Exception):
+        try:
+            document_record = await self.dbops.record_document_failure(
+                document.uuid,
+                error=f"{type(error).__name__}: {error}"[:2000],
+                max_attempts=settings.INDEXING_MAX_ATTEMPTS,
+                base_delay_seconds=settings.INDEXING_RETRY_BASE_SECONDS,
+                max_delay_seconds=settings.INDEXING_RETRY_MAX_SECONDS,
+            )
+            if document_record and document_record.is_dead_lettered:
+                log.warning(
+                    f"Dead-lettered {document.url} after "
+                    f"{document_record.attempt_count} attempts"
+                )
+        except Exception as e:
+            log.error(f"Error recording failure of {document.url}: {e}", exc_info=True)
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.in_flight)
+
+    def free_slots(self) -> int:
+        return max(settings.INDEXING_CLAIM_BATCH_SIZE - len(self.in_flight), 0)
+
+    def _on_done(self, task: asyncio.Task):
+        self.in_flight.discard(task)
+        if not task.cancelled() and task.exception():
+            # index_document records its own failures, this is e.g. a lost release
+            log.error(f"Indexing task failed: {task.exception()}")
+
+    async def submit(self, documents):
+        """
+        Starts indexing the documents in the background, or indexes them one by one
+        when INDEXING_CONCURRENT is off.
+        """
+        if not settings.INDEXING_CONCURRENT:
+            for document in tqdm(documents):
+                await self.index_document(document, self.stats)
+            self.log_stats()
+            return
+        if not self.in_flight and not self.stats.documents():
+            # start the clock when the pipeline gets busy, not when it went idle
+            self.stats = StageStats(self.STAGES)
+        for document in documents:
+            task = asyncio.create_task(self.index_document(document, self.stats))
+            self.in_flight.add(task)
+            task.add_done_callback(self._on_done)
+
+    async def wait_for_free_slot(self, timeout: float):
+        if self.in_flight:
+            await asyncio.wait(
+                self.in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+    def log_stats(self):
+        log.info(self.stats.summary())
+        log.info(f"Meilisearch writer: {gym_index.meilisearch_writer.get_stats()}")
+        self.stats = StageStats(self.STAGES)
+
+
+async def delete_documents(dbops: DbOps, documents_to_delete):
+    """
+    Deletes documents with one Qdrant call and one Meilisearch call per repo.
+    """
+    documents_by_repo = defaultdict(list)
+    for document in documents_to_delete:
+        documents_by_repo[document.repo].append(document)
+    for repo, documents in documents_by_repo.items():
+        links = [document.url for document in documents]
+        try:
+            # Delete from qdrant
+            gym_index.delete_from_qdrant_collection(links, collection_name=repo)
+            # Delete from meilisearch
+            gym_index.delete_from_meilisearch_collection(links, collection_name=repo)
+            # Mark the documents as no longer indexed
+            await dbops.update_documents_status_by_uuids(
+                [document.uuid for document in documents], False
+            )
+            log.info(f"Deleted {len(links)} documents from {repo}")
+        except Exception as e:
+            log.error(f"Error deleting documents from {repo}: {e}", exc_info=True)
+
+
 async def index_documents():
     prisma_client = await prisma_singleton.get_client()
     dbops = DbOps(prisma_client)
+    # every worker gets its own id, so several indexing services can share the table
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    pipeline = IndexingPipeline(dbops, worker_id)
+    log.info(f"Starting indexing worker {worker_id}")
+    wakeup_listener = WakeupListener()
+    next_housekeeping = 0.0
     while True:
+        had_work = False
+        documents = []
+        free_slots = pipeline.free_slots()
         try:
-            # Fetch documents that are not indexed and not deleted
-            documents = await dbops.get_documents_to_index()
+            # while documents are in flight this loop runs on every finished one,
+            # so leases and deletes are only looked at every INDEXING_POLL_MIN_SECONDS
+            housekeeping = not pipeline.busy or time.monotonic() >= next_housekeeping
+            if housekeeping:
+                next_housekeeping = (
+                    time.monotonic() + settings.INDEXING_POLL_MIN_SECONDS
+                )
+                expired = await dbops.release_expired_leases()
+                if expired:
+                    log.warning(
+                        f"Released {expired} expired leases, they will be retried"
+                    )
+            # Claim documents that are not indexed, or indexed documents whose
+            # source changed and are refreshed incrementally, for the free slots
+            if free_slots:
+                documents = await dbops.claim_documents_to_index(
+                    worker_id,
+                    limit=free_slots,
+                    lease_seconds=settings.INDEXING_LEASE_SECONDS,
+                )
             if documents:
-                log.info(f"Indexing {len(documents)} documents")
-                for document in tqdm(documents):
-                    log.info(f"Indexing document: {document.url}")
-                    try:
-                        # Index the document
-                        meta_to_add_to_index: PayloadForIndexing = (
-                            extractor_agent.forward(document.url)
-                        )
-                        gym_index.add_to_qdrant_collection(
-                            meta_to_add_to_index, collection_name=document.repo
-                        )
-                        gym_index.add_to_meilisearch_collection(
-                            meta_to_add_to_index, collection_name=document.repo
-                        )
-
-                        # Update the document status to indexed
-                        await dbops.update_document_status_by_uuid(document.uuid, True)
-                    except Exception as e:
-                        log.error(
-                            f"Error indexing document {document.url}: {e}",
-                            exc_info=True,
-                        )
-            else:
-                log.info("No documents to index")
-
-            # Fetch the documents to delete
-            documents_to_delete = await dbops.get_documents_to_delete()
-            if documents_to_delete:
-                log.info(f"Deleting {len(documents_to_delete)} documents")
-                for document in tqdm(documents_to_delete):
-                    try:
-                        # Delete from qdrant
-                        gym_index.delete_from_qdrant_collection(
-                            [document.url], collection_name=document.repo
-                        )
-                        # Delete from meilisearch
-                        gym_index.delete_from_meilisearch_collection(
-                            [document.url], collection_name=document.repo
-                        )
-                        # Update the document status to not deleted
-                        await dbops.update_document_status_by_uuid(document.uuid, False)
-                    except Exception as e:
-                        log.error(
-                            f"Error deleting document {document.url}: {e}",
-                            exc_info=True,
-                        )
-            else:
-                log.info("No documents to delete")
+                had_work = True
+                log.info(
+                    f"Indexing {len(documents)} documents, "
+                    f"{len(pipeline.in_flight)} already in flight"
+                )
+                await pipeline.submit(documents)
+
+            if housekeeping:
+                # Fetch the documents to delete
+                documents_to_delete = await dbops.get_documents_to_delete()
+                if documents_to_delete:
+                    had_work = True
+                    log.info(f"Deleting {len(documents_to_delete)} documents")
+                    await delete_documents(dbops, documents_to_delete)
 
         except Exception as e:
             log.error(f"Error in indexing loop: {e}", exc_info=True)
 
-        await asyncio.sleep(5)  # Poll every 5 seconds
+        wakeup_listener.record_activity(had_work or pipeline.busy)
+        if pipeline.busy:
+            # refill a slot as soon as its document finishes
+            await pipeline.wait_for_free_slot(settings.INDEXING_POLL_MIN_SECONDS)
+            continue
+        if settings.INDEXING_CONCURRENT and pipeline.stats.documents():
+            # the pipeline drained, report on everything since it got busy
+            pipeline.log_stats()
+        if free_slots and len(documents) == free_slots:
+            # a full claim may leave more documents behind, look again right away
+            continue
+        log.info("No documents to index")
+        # Block until the webhook wakes us up, polling adaptively as a fallback
+        await wakeup_listener.wait()
+
+
+def exit_on_sigterm(signum, frame):
+    raise SystemExit(128 + signum)
 
 
 if __name__ == "__main__":
+    # atexit does not run when the process is killed by SIGTERM, so it is turned
+    # into a regular exit, which flushes the meilisearch writer through atexit
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
     asyncio.run(index_documents())
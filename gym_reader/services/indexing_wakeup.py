@@ -0,0 +1,76 @@
+import asyncio
+from gym_reader.clients.redis_client import redis_client
+from gym_reader.logger import get_logger
+from gym_reader.settings import get_settings
+
+log = get_logger(__name__)
+settings = get_settings()
+
+WAKEUP_STREAM = "indexing:wakeups"
+
+
+def notify_indexer(repo: str, reason: str):
+    """
+    Wakes up the indexing services, e.g. after the webhook stored new links.
+    """
+    try:
+        redis_client.xadd(
+            WAKEUP_STREAM,
+            {"repo": repo, "reason": reason},
+            maxlen=1000,
+            approximate=True,
+        )
+    except Exception as e:
+        # the indexer still polls, so a lost wakeup only delays indexing
+        log.error(f"Error notifying the indexer: {e}", exc_info=True)
+
+
+class WakeupListener:
+    """
+    Blocks until a wakeup arrives on the stream or the poll interval elapses.
+
+    The poll interval is only a fallback. It starts at INDEXING_POLL_MIN_SECONDS,
+    doubles every idle loop up to INDEXING_POLL_MAX_SECONDS, and resets as soon as
+    there is work, so an idle indexer barely touches the database.
+    """
+
+    def __init__(self):
+        self.last_id = None
+        self.poll_seconds = settings.INDEXING_POLL_MIN_SECONDS
+
+    def record_activity(self, had_work: bool):
+        if had_work:
+            self.poll_seconds = settings.INDEXING_POLL_MIN_SECONDS
+        else:
+            self.poll_seconds = min(
+                self.poll_seconds * 2, settings.INDEXING_POLL_MAX_SECONDS
+            )
+
+    def _read(self) -> bool:
+        if self.last_id is None:
+            # only wakeups sent after the listener started, including the ones sent
+            # while the indexer was busy between two reads
+            latest = redis_client.xrevrange(WAKEUP_STREAM, count=1)
+            self.last_id = latest[0][0] if latest else "0-0"
+        response = redis_client.xread(
+            {WAKEUP_STREAM: self.last_id},
+            block=int(self.poll_seconds * 1000),
+            count=100,
+        )
+        if not response:
+            return False
+        _, entries = response[0]
+        self.last_id = entries[-1][0]
+        log.info(f"Woken up by {len(entries)} events: {entries[-1][1]}")
+        return True
+
+    async def wait(self) -> bool:
+        """
+        Returns True when woken up by an event, False when the poll interval elapsed.
+        """
+        try:
+            return await asyncio.to_thread(self._read)
+        except Exception as e:
+            log.error(f"Error waiting for wakeups: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_seconds)
+            return False
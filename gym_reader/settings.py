@@ -1,7 +1,7 @@
 from enum import Enum
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import dspy
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Environment(str, Enum):
@@ -25,6 +25,13 @@ class Settings(BaseSettings):
     CONFIG_FILE_PATH: str = "gym_reader/config.yaml"
     TAVILY_API_KEY: str = ""
     SPIDER_API_KEY: str = ""
+    SPIDER_MAX_CONNECTIONS: int = 20
+    SPIDER_MAX_CONCURRENCY_PER_HOST: int = 4
+    SPIDER_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    LOCAL_CRAWLER_MAX_CONNECTIONS: int = 20
+    LOCAL_CRAWLER_TIMEOUT_SECONDS: float = 30.0
+    LOCAL_CRAWLER_CONVERT_WORKERS: int = 2
+    LOCAL_CRAWLER_USER_AGENT: str = "gym-reader/1.0"
     GITHUB_SECRET_KEY_FOR_WEBHOOK: str = ""
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -33,6 +40,57 @@ class Settings(BaseSettings):
     IP_TOKEN_LIMIT: int = 120000  # Example per-IP limit
     MAX_TOKENS_PER_CHUNK: int = 1000
     OVERLAP_TOKENS_PER_CHUNK: int = 100
+    EMBEDDING_PROVIDER_FOR_SUMMARY: str = "openai"  # "openai" or "local"
+    EMBEDDING_PROVIDER_FOR_CONTENT: str = "openai"  # "openai" or "local"
+    OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    OPENAI_EMBEDDING_DIMENSION: int = 1536
+    LOCAL_EMBEDDING_MODEL: str = "BAAI/bge-small-en-v1.5"
+    LOCAL_EMBEDDING_DIMENSION: int = 384
+    LOCAL_EMBEDDING_THREADS: Optional[int] = None  # None lets onnxruntime decide
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 64
+    # the local model truncates its input at 512 of its own (WordPiece) tokens,
+    # which run longer than cl100k tokens, so its chunks are cut with a margin
+    LOCAL_EMBEDDING_MAX_CHUNK_TOKENS: int = 400
+    MAX_TOKENS_PER_EMBEDDING_INPUT: int = 7000
+    MEILISEARCH_BATCH_MAX_BYTES: int = 5 * 1024 * 1024  # uncompressed ndjson
+    MEILISEARCH_FLUSH_INTERVAL_SECONDS: float = 2.0
+    MEILISEARCH_TASK_POLL_SECONDS: float = 5.0
+    MEILISEARCH_WRITE_TIMEOUT_SECONDS: float = 120.0
+    SEARCH_DOCUMENT_CANDIDATES: int = 10  # documents whose chunks are searched
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = 2048
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 60 * 60
+    BLOCKING_EXECUTOR_WORKERS: int = 16
+    QDRANT_DEFAULT_STORAGE_PROFILE: str = "default"
+    QDRANT_STORAGE_PROFILES: Dict[str, str] = {}  # repo -> storage profile name
+    # how long a process keeps the profiles saved by the migrate command
+    QDRANT_STORAGE_PROFILE_REFRESH_SECONDS: int = 60
+    QDRANT_BENCHMARK_SAMPLE_POINTS: int = 10000
+    MAX_TOKENS_PER_EMBEDDING_REQUEST: int = 250000  # OpenAI caps a request at 300k
+    MAX_INPUTS_PER_EMBEDDING_REQUEST: int = 2048
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MEMORY_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_REDIS_MAX_ENTRIES: int = 200000
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+    # documents above this size are extracted section by section (map-reduce)
+    EXTRACTION_LONG_DOCUMENT_THRESHOLD_TOKENS: int = 24000
+    EXTRACTION_SECTION_TOKENS: int = 8000
+    EXTRACTION_SECTION_OVERLAP_TOKENS: int = 200
+    EXTRACTION_MAX_SECTIONS: int = 16
+    EXTRACTION_MAP_CONCURRENCY: int = 4
+    EXTRACTION_REDUCE_MODEL: str = "gpt-4o-mini"
+    INDEXING_CONCURRENT: bool = True
+    INDEXING_POLL_MIN_SECONDS: float = 5.0
+    INDEXING_POLL_MAX_SECONDS: float = 300.0
+    INDEXING_CLAIM_BATCH_SIZE: int = 50
+    INDEXING_LEASE_SECONDS: int = 900
+    INDEXING_MAX_ATTEMPTS: int = 5
+    INDEXING_RETRY_BASE_SECONDS: int = 60
+    INDEXING_RETRY_MAX_SECONDS: int = 6 * 60 * 60
+    INDEXING_CRAWL_CONCURRENCY: int = 8
+    INDEXING_EXTRACTION_CONCURRENCY: int = 4
+    INDEXING_EMBEDDING_CONCURRENCY: int = 4
+    INDEXING_WRITE_CONCURRENCY: int = 4
 
     def is_dev(self):
         return self.ENVIRONMENT == Environment.Development
@@ -85,4 +143,6 @@ def get_settings():
     return Settings()
 
 
-TOKEN_MIDDLEWARES = ["/api/v1/contextual_chat"]
+TOKEN_MIDDLEWARES = ["/api/v1/contextual_chat", "/api/v1/contextual_chat/stream"]
+# Server-Sent Events endpoints, which must not be buffered by compression
+STREAMING_PATHS = ["/api/v1/contextual_chat/stream"]
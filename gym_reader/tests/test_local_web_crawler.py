@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from gym_reader.clients.local_web_crawler import local_crawler_client
+
+PAGES = {
+    "/": (
+        "text/html; charset=utf-8",
+        "<html><body><nav><a href='/nav'>Nav</a></nav>"
+        "<h1>Guide</h1><p>Read the <a href='/install'>install</a> page.</p>"
+        "<ul><li><a href='/manual.pdf'>Manual</a></li>"
+        "<li><a href='https://example.com/elsewhere'>Elsewhere</a></li>"
+        "<li><a href='/usage#flags'>Usage</a></li></ul>"
+        "<pre>pip install gym</pre></body></html>",
+    ),
+    "/install": ("text/html", "<h2>Install</h2><p>Use <code>pip</code>.</p>"),
+    "/usage": ("text/html", "<h2>Usage</h2><p>Run it.</p>"),
+    "/manual.pdf": ("application/pdf", "%PDF-1.4 binary"),
+}
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        content_type, body = PAGES[self.path]
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+async def crawl(url: str, limit: int):
+    try:
+        return await local_crawler_client.crawl(url, limit=limit)
+    finally:
+        # the client is bound to the event loop of this test
+        await local_crawler_client.client.aclose()
+        local_crawler_client.client = None
+
+
+def test_crawl_converts_the_parent_and_same_host_children(base_url):
+    pages = asyncio.run(crawl(f"{base_url}/", limit=10))
+
+    assert [page["url"] for page in pages] == [
+        f"{base_url}/",
+        f"{base_url}/install",
+        f"{base_url}/usage",
+    ]
+    parent = pages[0]["content"]
+    assert parent.startswith("# Guide")
+    assert f"Read the [install]({base_url}/install) page." in parent
+    assert "```\npip install gym\n```" in parent
+    assert "Nav" not in parent
+    assert pages[1]["content"] == "## Install\n\nUse `pip`."
+
+
+def test_crawl_respects_the_limit(base_url):
+    pages = asyncio.run(crawl(f"{base_url}/", limit=2))
+
+    assert [page["url"] for page in pages] == [f"{base_url}/", f"{base_url}/install"]
+
+
+def test_crawl_rejects_a_non_html_page(base_url):
+    with pytest.raises(ValueError):
+        asyncio.run(crawl(f"{base_url}/manual.pdf", limit=2))